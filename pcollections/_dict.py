@@ -26,6 +26,111 @@ from .abc import (
 )
 
 
+# A sentinel for values that are not in a dict.
+_absent = object()
+
+
+#===============================================================================
+# Collision Buckets
+# Both pdict and tdict store a PHAMT (_idx) that maps hash(key) to an entry
+# (index, (key, value)), where index is the key's position in the PHAMT of
+# insertion-ordered (key, value) pairs (_els). When two keys share a hash, the
+# entry is instead a _bucket of such entries.
+
+class _bucket(tuple):
+    """A tuple of `(index, (key, value))` entries whose keys share a hash."""
+    __slots__ = ()
+def _bucket_find(bucket, key):
+    """Returns the position in `bucket` of the entry for `key` or `None`."""
+    for (pos, ent) in enumerate(bucket):
+        k0 = ent[1][0]
+        if key is k0 or key == k0:
+            return pos
+    return None
+def _bucket_drop(bucket, pos):
+    """Returns the entry or bucket that remains when the entry at position
+    `pos` is removed from `bucket`."""
+    rest = bucket[:pos] + bucket[pos+1:]
+    return rest[0] if len(rest) == 1 else _bucket(rest)
+
+
+#===============================================================================
+# Incremental Hashing
+# The hash of a pdict is the XOR of the hashes of its (key, value) pairs. This
+# is independent of order, so it can be updated in constant time whenever a
+# pdict with a known hashcode is edited.
+
+def _hash_update(hashcode, old_kv, new_kv):
+    """Returns `hashcode` updated to drop `old_kv` and to include `new_kv`.
+
+    Either `old_kv` or `new_kv` may be `None` to indicate that no pair is
+    dropped or included. If `hashcode` is `None` or `new_kv` is not hashable,
+    then `None` is returned.
+    """
+    if hashcode is None:
+        return None
+    if old_kv is not None:
+        hashcode ^= hash(old_kv)
+    if new_kv is not None:
+        try:
+            hashcode ^= hash(new_kv)
+        except TypeError:
+            return None
+    return hashcode
+
+
+#===============================================================================
+# Reverse Iteration
+# The PHAMTs can't be iterated in reverse, but the insertion indices of a dict
+# are all less than its _top, so we can look them up in descending order.
+
+def _reversed_els(els, top):
+    """Yields the `(key, value)` pairs of `els` in reverse insertion order.
+
+    `els` must be the `_els` PHAMT or THAMT of a `pdict` or `tdict` whose next
+    insertion index is `top`.
+    """
+    n = len(els)
+    if 2*n < top:
+        # The indices are sparse, so it's faster to reverse a list of them.
+        for (ii,kv) in reversed(list(els)):
+            yield kv
+        return
+    get = els.get
+    ii = top
+    while n > 0:
+        ii -= 1
+        kv = get(ii, None)
+        if kv is not None:
+            n -= 1
+            yield kv
+
+
+#===============================================================================
+# Small pdicts
+# A pdict with at most _SMALL_MAX keys also keeps a plain dict (_small) of its
+# contents; lookups in such a pdict use the dict, which is much faster than the
+# PHAMT for small sizes. The dict is copied on every edit and never mutated.
+
+_SMALL_MAX = 16
+def _small_assoc(small, key, val):
+    """Returns a copy of the small dict with `key` mapped to `val`, or `None` if
+    `small` is `None` or the copy would be too large."""
+    if small is None or (len(small) >= _SMALL_MAX and key not in small):
+        return None
+    small = small.copy()
+    small[key] = val
+    return small
+def _small_dissoc(small, key):
+    """Returns a copy of the small dict without `key` or `None` if `small` is
+    `None`."""
+    if small is None:
+        return None
+    small = small.copy()
+    small.pop(key, None)
+    return small
+
+
 #===============================================================================
 # pdict
 # The persistent dict type.
@@ -39,9 +144,12 @@ class PDictView(MappingView):
         object.__setattr__(obj, '_mapping', d)
         return obj
     def __iter__(self):
-        return map(lambda arg: self._from_kv(arg[1]), self._mapping._els)
+        from_kv = self._from_kv
+        return (from_kv(arg[1]) for arg in self._mapping._els)
     def __reversed__(self):
-        return reversed(list(self.__iter__()))
+        from_kv = self._from_kv
+        d = self._mapping
+        return (from_kv(kv) for kv in _reversed_els(d._els, d._top))
     def __len__(self):
         return len(self._mapping)
     # Abstract methods that must be overloaded by the concrete view classes
@@ -54,10 +162,13 @@ class pdict_keys(KeysView, PDictView):
     __slots__ = ()
     def _from_kv(self, kv):
         return kv[0]
+    def __iter__(self):
+        return iter(self._mapping)
     def __contains__(self, k):
         return (k in self._mapping)
     def __reversed__(self):
-        return reversed(list(self.__iter__()))
+        d = self._mapping
+        return (kv[0] for kv in _reversed_els(d._els, d._top))
     def __repr__(self):
         s = ", ".join(map(repr, iter(self)))
         return f"pdict_keys({{{s}}})"
@@ -68,22 +179,33 @@ class pdict_items(ItemsView, PDictView):
     __slots__ = ()
     def _from_kv(self, kv):
         return kv
+    def __iter__(self):
+        small = self._mapping._small
+        if small is not None:
+            return iter(small.items())
+        return (arg[1] for arg in self._mapping._els)
     def __contains__(self, kv):
         if not isinstance(kv, tuple) or len(kv) != 2:
             return False
-        (k0,v0) = self._from_kv(kv)
-        d = Ellipsis if v0 is None else None
-        v = self._mapping.get(k0, d)
-        (k,v) = self._from_kv((k0,v))
-        return v0 == v
+        (k0,v0) = kv
+        v = self._mapping.get(k0, _absent)
+        return v is not _absent and (v is v0 or v == v0)
 class pdict_values(ValuesView, PDictView):
     __slots__ = ()
     def _from_kv(self, kv):
         return kv[1]
+    def __iter__(self):
+        small = self._mapping._small
+        if small is not None:
+            return iter(small.values())
+        return (arg[1][1] for arg in self._mapping._els)
     def __contains__(self, v):
-        for ent in self._mapping._els:
-            v0 = self._from_kv(ent[1][0])
-            if v0 == v:
+        small = self._mapping._small
+        if small is not None:
+            return v in small.values()
+        for arg in self._mapping._els:
+            v0 = arg[1][1]
+            if v0 is v or v0 == v:
                 return True
         return False
 class pdict(PersistentMapping):
@@ -99,14 +221,42 @@ class pdict(PersistentMapping):
     """
     empty = None
     @classmethod
-    def _new(cls, els, idx, top):
+    def _new(cls, els, idx, top, hashcode=None, small=None):
+        if small is None and len(els) <= _SMALL_MAX:
+            small = {kv[0]: kv[1] for (ii,kv) in els}
         new_pdict = super(pdict, cls).__new__(cls)
-        object.__setattr__(new_pdict, '_els', els)
-        object.__setattr__(new_pdict, '_idx', idx)
-        object.__setattr__(new_pdict, '_top', top)
-        object.__setattr__(new_pdict, '_hashcode', None)
+        _pdict_set_els(new_pdict, els)
+        _pdict_set_idx(new_pdict, idx)
+        _pdict_set_top(new_pdict, top)
+        _pdict_set_hashcode(new_pdict, hashcode)
+        _pdict_set_small(new_pdict, small)
         return new_pdict
-    __slots__ = ("_els", "_idx", "_top", "_hashcode")
+    __slots__ = ("_els", "_idx", "_top", "_hashcode", "_small")
+    @classmethod
+    def _from_dict(cls, d):
+        # Builds a pdict from a dict; because the keys in a dict are unique, we
+        # don't need to check for existing keys, only for hash collisions.
+        kvs = list(d.items())
+        if not kvs:
+            return cls.empty
+        els = PHAMT.from_iter(kvs)
+        hs = list(map(hash, d))
+        idx = THAMT(PHAMT.empty)
+        if len(set(hs)) == len(hs):
+            for (ii,h) in enumerate(hs):
+                idx[h] = (ii, kvs[ii])
+        else:
+            for (ii,h) in enumerate(hs):
+                ent = (ii, kvs[ii])
+                prev = idx.get(h, None)
+                if prev is None:
+                    idx[h] = ent
+                elif type(prev) is tuple:
+                    idx[h] = _bucket((prev, ent))
+                else:
+                    idx[h] = _bucket(prev + (ent,))
+        small = dict(d) if len(kvs) <= _SMALL_MAX else None
+        return cls._new(els, idx.persistent(), len(kvs), None, small)
     def __new__(cls, *args, **kw):
         n = len(args)
         if n == 1:
@@ -124,59 +274,95 @@ class pdict(PersistentMapping):
         if not kw:
             # If arg is a tdict and no keyword arguments have been given, this
             # is a special case.
-            if isinstance(arg, Sized) and len(arg) == 0:
+            if type(arg) is cls:
+                return arg
+            elif isinstance(arg, Sized) and len(arg) == 0:
                 return cls.empty
             elif isinstance(arg, tdict):
+                if type(arg._orig) is cls:
+                    return arg._orig
                 return cls._new(
                     arg._els.persistent(),
                     arg._idx.persistent(),
-                    arg._top)
+                    arg._top,
+                    arg._hashcode)
             elif isinstance(arg, cls):
                 # Also, if it's already the right type, we can just return it
                 # as-is.
                 return arg
             elif isinstance(arg, pdict):
-                return cls._new(arg._els, arg._idx, arg._top)
-        # For anything else, however, we just route this through tdict.
-        t = tdict(arg, **kw)
-        return cls._new(
-            t._els.persistent(),
-            t._idx.persistent(),
-            t._top)
+                return cls._new(arg._els, arg._idx, arg._top,
+                                arg._hashcode, arg._small)
+            elif type(arg) is dict:
+                return cls._from_dict(arg)
+        if isinstance(arg, (pdict, tdict)):
+            # Keyword arguments were given along with a pdict or tdict; we
+            # route these through tdict so that lazy values aren't evaluated.
+            t = tdict(arg, **kw)
+            return cls._new(
+                t._els.persistent(),
+                t._idx.persistent(),
+                t._top)
+        # For anything else, we build a dict, which handles repeated keys the
+        # same way we do, and bulk-load the dict.
+        return cls._from_dict(dict(arg, **kw))
     def __hash__(self):
         if self._hashcode is None:
-            h = PersistentMapping.__hash__(self)
-            object.__setattr__(self, '_hashcode', h)
+            h = 0
+            for (ii,kv) in self._els:
+                h ^= hash(kv)
+            _pdict_set_hashcode(self, h)
         return self._hashcode
     def __len__(self):
         return len(self._els)
     def __contains__(self, k):
-        h = hash(k)
-        ii = self._idx.get(h, None)
-        while ii is not None:
-            ((kk,vv),ii) = self._els[ii]
-            if k == kk:
-                return True
-        return False
+        small = self._small
+        if small is not None:
+            return k in small
+        ent = self._idx.get(hash(k), None)
+        if ent is None:
+            return False
+        elif type(ent) is tuple:
+            k0 = ent[1][0]
+            return k is k0 or k == k0
+        else:
+            return _bucket_find(ent, k) is not None
     def __iter__(self):
-        return map(lambda arg: arg[1][0][0], self._els)
+        small = self._small
+        if small is not None:
+            return iter(small)
+        return (arg[1][0] for arg in self._els)
     def __reversed__(self):
         return reversed(self.keys())
     def __getitem__(self, key):
-        h = hash(key)
-        ii = self._idx.get(h, None)
-        while ii is not None:
-            (kv,ii) = self._els[ii]
-            if key == kv[0]:
-                return kv[1]
+        small = self._small
+        if small is not None:
+            return small[key]
+        ent = self._idx.get(hash(key), None)
+        if ent is not None:
+            if type(ent) is tuple:
+                kv = ent[1]
+                if key is kv[0] or key == kv[0]:
+                    return kv[1]
+            else:
+                for (ii,kv) in ent:
+                    if key is kv[0] or key == kv[0]:
+                        return kv[1]
         raise KeyError(key)
     def get(self, key, default=None):
-        h = hash(key)
-        ii = self._idx.get(h, None)
-        while ii is not None:
-            (kv,ii) = self._els[ii]
-            if key == kv[0]:
-                return kv[1]
+        small = self._small
+        if small is not None:
+            return small.get(key, default)
+        ent = self._idx.get(hash(key), None)
+        if ent is not None:
+            if type(ent) is tuple:
+                kv = ent[1]
+                if key is kv[0] or key == kv[0]:
+                    return kv[1]
+            else:
+                for (ii,kv) in ent:
+                    if key is kv[0] or key == kv[0]:
+                        return kv[1]
         return default
     def transient(self):
         """Returns a transient copy of the dict in constant time."""
@@ -184,70 +370,139 @@ class pdict(PersistentMapping):
     def set(self, key, val):
         """Returns a copy of the pdict that maps the given key to the given
         value."""
-        # Get the hash and initial index (if there is one).
+        return self._set(key, val, True)
+    def setdefault(self, key, default=None):
+        """Returns a copy of the pdict with the key inserted with a value of
+        default, if key is not already in the pdict.
+        """
+        return self._set(key, default, False)
+    def _set(self, key, val, replace):
+        # Implements set (replace=True) and setdefault (replace=False) with a
+        # single lookup of the key's entry.
+        # Get the hash and the entry for it (if there is one).
         h = hash(key)
-        ii = self._idx.get(h, None)
-        if ii is None:
+        idx = self._idx
+        ent = idx.get(h, None)
+        top = self._top
+        if ent is None:
             # The object's hash is not here yet, so we can append to els and
             # insert it into idx.
-            new_els = self._els.assoc(self._top, ((key, val), None))
-            new_idx = self._idx.assoc(h, self._top)
+            kv = (key, val)
+            new_idx = idx.assoc(h, (top, kv))
+        elif type(ent) is tuple:
+            (ii,kv) = ent
+            if key is kv[0] or key == kv[0]:
+                # It is in the dict; either it's exactly in the dict or we
+                # replace it.
+                if not replace or val is kv[1]:
+                    return self
+                # Like dict, we keep the original key object.
+                (old_kv, kv) = (kv, (kv[0], val))
+                hc = _hash_update(self._hashcode, old_kv, kv)
+                small = _small_assoc(self._small, key, val)
+                new_els = self._els.assoc(ii, kv)
+                new_idx = idx.assoc(h, (ii, kv))
+                return self._new(new_els, new_idx, top, hc, small)
+            # A new hash collision: the entry becomes a bucket.
+            kv = (key, val)
+            new_idx = idx.assoc(h, _bucket((ent, (top, kv))))
         else:
-            # First make sure it's not already in the dict.
-            while ii is not None:
-                (kv,ii_next) = self._els[ii]
-                (k,v) = kv
-                if key == k:
-                    # It is in the dict; either it's exactly in the dict or we
-                    # replace it.
-                    if val is v:
-                        return self
-                    else:
-                        new_els = self._els.assoc(ii, ((key,val), ii_next))
-                        return self._new(new_els, self._idx, self._top)
-            # If we reach this point, we can add the object to the end of the
-            # list.
-            new_els = self._els.assoc(self._top, ((key,val), None))
-            new_els = new_els.assoc(ii, (kv, self._top))
-        return self._new(new_els, new_idx, self._top + 1)
+            pos = _bucket_find(ent, key)
+            if pos is not None:
+                (ii,kv) = ent[pos]
+                if not replace or val is kv[1]:
+                    return self
+                # Like dict, we keep the original key object.
+                (old_kv, kv) = (kv, (kv[0], val))
+                hc = _hash_update(self._hashcode, old_kv, kv)
+                small = _small_assoc(self._small, key, val)
+                bucket = _bucket(ent[:pos] + ((ii, kv),) + ent[pos+1:])
+                new_els = self._els.assoc(ii, kv)
+                new_idx = idx.assoc(h, bucket)
+                return self._new(new_els, new_idx, top, hc, small)
+            kv = (key, val)
+            new_idx = idx.assoc(h, _bucket(ent + ((top, kv),)))
+        # If we reach this point, we add the key to the end of els.
+        new_els = self._els.assoc(top, kv)
+        hc = _hash_update(self._hashcode, None, kv)
+        small = _small_assoc(self._small, key, val)
+        return self._new(new_els, new_idx, top + 1, hc, small)
     def drop(self, key):
         """Returns a copy of the pdict that does not include the given key.
 
         If the key is not in the dict, returns the dict unchanged.
         """
-        # Get the hash and initial index (if there is one).
+        # Get the hash and the entry for it (if there is one).
         h = hash(key)
-        ii = self._idx.get(h, None)
-        # First make sure it's not already in the set.
-        ii_prev = None
-        kv_prev = None
-        while ii is not None:
-            (kv,ii_next) = self._els[ii]
-            (k,v) = kv
-            if key == k:
-                # We remove this entry!
-                if ii_prev is None:
-                    # We're removing from the front of the list.
-                    if ii_next is None:
-                        new_idx = self._idx.dissoc(h)
-                    else:
-                        new_idx = self._idx.assoc(h, ii_next)
-                    new_els = self._els
-                else:
-                    # We're removing from the end or the middle.
-                    new_idx = self._idx
-                    new_els = self._els.assoc(ii_prev, (kv_prev, ii_next))
-                new_els = new_els.dissoc(ii)
-                return self._new(new_els, new_idx, self._top)
-            ii_prev = ii
-            kv_prev = kv
-            ii = ii_next
-        # If we reach this point, then obj isn't in the set, so we just return
-        # self unchanged.
-        return self
+        ent = self._idx.get(h, None)
+        if ent is None:
+            return self
+        elif type(ent) is tuple:
+            if not (key is ent[1][0] or key == ent[1][0]):
+                return self
+            (ii,kv) = ent
+            new_idx = self._idx.dissoc(h)
+        else:
+            pos = _bucket_find(ent, key)
+            if pos is None:
+                return self
+            (ii,kv) = ent[pos]
+            new_idx = self._idx.assoc(h, _bucket_drop(ent, pos))
+        hc = _hash_update(self._hashcode, kv, None)
+        small = _small_dissoc(self._small, key)
+        return self._new(self._els.dissoc(ii), new_idx, self._top, hc, small)
+    def delete(self, key):
+        """Returns a copy of the pdict that excludes the given key.
+
+        If the key is not found in the pdict, a `KeyError` is raised.
+        """
+        # The drop method hashes the key only once and returns self when the
+        # key is missing, so we don't need to check for the key first.
+        new_pdict = self.drop(key)
+        if new_pdict is self:
+            raise KeyError(key)
+        return new_pdict
     def clear(self):
         """Returns the empty pdict."""
         return type(self).empty
+    def update(self, *args, **kw):
+        """Returns a copy of the pdict with the key-value pairs in the
+        iterable/mapping `arg` and the keyword arguments included.
+
+        Multiple arguments may be provided, but they must each be a mapping or
+        an iterable of items.
+        """
+        if not kw and all(isinstance(arg, Sized) and len(arg) == 0
+                          for arg in args):
+            # Nothing to add (this includes calls without any arguments).
+            return self
+        if len(args) == 1:
+            arg = args[0]
+            if not kw and type(arg) is type(self) and len(self) == 0:
+                # Updating an empty pdict with one of the same type needs no
+                # edits.
+                return arg
+            elif len(self) == 0 and type(arg) is dict:
+                # Updating an empty pdict with a dict can be bulk-loaded.
+                return type(self)._from_dict(dict(arg, **kw) if kw else arg)
+        t = self.transient()
+        setitem = t.__setitem__
+        for arg in args:
+            if type(arg) is pdict:
+                # We can read the items of a pdict straight out of its els.
+                for (ii,kv) in arg._els:
+                    setitem(kv[0], kv[1])
+            elif type(arg) is dict:
+                for (k,v) in arg.items():
+                    setitem(k, v)
+            else:
+                if isinstance(arg, Mapping):
+                    arg = arg.items()
+                for (k,v) in arg:
+                    setitem(k, v)
+        for (k,v) in kw.items():
+            setitem(k, v)
+        return self._from_transient(t)
     # We include reimplements for some of these because we can improve them in
     # some non-trivial way.
     def pop(self, key, *args):
@@ -261,43 +516,58 @@ class pdict(PersistentMapping):
         if nargs > 1:
             raise TypeError(f"pop expected at most 2 arguments, got {nargs}")
         h = hash(key)
-        ii = self._idx.get(h, None)
-        ii_prev = None
-        kv_prev = None
-        while ii is not None:
-            (kv,ii_next) = self._els[ii]
-            (k,v) = kv
-            if key == k:
-                # We remove this entry!
-                if ii_prev is None:
-                    # We're removing from the front of the list.
-                    if ii_next is None:
-                        new_idx = self._idx.dissoc(h)
-                    else:
-                        new_idx = self._idx.assoc(h, ii_next)
-                    new_els = self._els
-                else:
-                    # We're removing from the end or the middle.
-                    new_idx = self._idx
-                    new_els = self._els.assoc(ii_prev, (kv_prev, ii_next))
-                new_els = new_els.dissoc(ii)
-                return (v, self._new(new_els, new_idx, self._top))
-            ii_prev = ii
-            kv_prev = kv
-            ii = ii_next
+        ent = self._idx.get(h, None)
+        if ent is None:
+            pos = None
+        elif type(ent) is tuple:
+            pos = 0 if key is ent[1][0] or key == ent[1][0] else None
+        else:
+            pos = _bucket_find(ent, key)
+        if pos is not None:
+            # We remove this entry!
+            if type(ent) is tuple:
+                (ii,kv) = ent
+                new_idx = self._idx.dissoc(h)
+            else:
+                (ii,kv) = ent[pos]
+                new_idx = self._idx.assoc(h, _bucket_drop(ent, pos))
+            new_els = self._els.dissoc(ii)
+            hc = _hash_update(self._hashcode, kv, None)
+            small = _small_dissoc(self._small, key)
+            new_pdict = self._new(new_els, new_idx, self._top, hc, small)
+            return (kv[1], new_pdict)
         # It's not here!
         if nargs == 0:
             raise KeyError(key)
         else:
             return (args[0], self)
+    def popitem(self):
+        """Returns a 2-tuple whose first element is itself a 2-tuple, `(key,
+        value)` from the pdict, and whose second element is a copy of the pdict
+        with the key-value pair removed.
+
+        Raises `KeyError` if the pdict is empty.
+        """
+        if len(self._els) == 0:
+            raise KeyError("popitem(): persistent mapping is empty")
+        key = next(iter(self))
+        (val, new_pdict) = self.pop(key)
+        return ((key, val), new_pdict)
     def keys(self):
         return pdict_keys(self)
     def items(self):
         return pdict_items(self)
     def values(self):
         return pdict_values(self)
+# Setters for the pdict slots; calling these directly is faster than going
+# through object.__setattr__ and likewise bypasses pdict.__setattr__.
+_pdict_set_els = pdict._els.__set__
+_pdict_set_idx = pdict._idx.__set__
+_pdict_set_top = pdict._top.__set__
+_pdict_set_hashcode = pdict._hashcode.__set__
+_pdict_set_small = pdict._small.__set__
 # Make the empty pdict.
-pdict.empty = pdict._new(PHAMT.empty, PHAMT.empty, 0)
+pdict.empty = pdict._new(PHAMT.empty, PHAMT.empty, 0, 0)
 
 
 #===============================================================================
@@ -321,7 +591,12 @@ class tdict_view(Set):
     def __iter__(self):
         return map(self._iter, self._tdict._els)
     def __reversed__(self):
-        return reversed(list(self.__iter__()))
+        d = self._tdict
+        v0 = self._version
+        for kv in _reversed_els(d._els, d._top):
+            if d._version > v0:
+                raise RuntimeError(f"{type(self)} changed during iteration")
+            yield self._from_kv(kv)
     def __len__(self):
         return len(self._tdict)
     # These are the abstract methods that need to be implemented in the actual
@@ -334,24 +609,51 @@ class tdict_keys(KeysView, tdict_view):
     __slots__ = ('_tdict', '_version')
     def _from_kv(self, arg):
         return arg[0]
+    def __iter__(self):
+        d = self._tdict
+        v0 = self._version
+        for arg in d._els:
+            if d._version > v0:
+                raise RuntimeError(f"{type(self)} changed during iteration")
+            yield arg[1][0]
     def __contains__(self, k):
         return (k in self._tdict)
 class tdict_items(ItemsView, tdict_view):
     __slots__ = ('_tdict', '_version')
     def _from_kv(self, arg):
         return arg
+    def __iter__(self):
+        d = self._tdict
+        v0 = self._version
+        for arg in d._els:
+            if d._version > v0:
+                raise RuntimeError(f"{type(self)} changed during iteration")
+            yield arg[1]
     def __contains__(self, kv):
         if not isinstance(kv, tuple) or len(kv) != 2:
             return False
-        d = Ellipsis if kv[1] is None else None
-        return self._tdict.get(kv[0], d) == kv[1]
+        (k0,v0) = kv
+        v = self._tdict.get(k0, _absent)
+        return v is not _absent and (v is v0 or v == v0)
 class tdict_values(ValuesView, tdict_view):
     __slots__ = ('_tdict', '_version')
     def _from_kv(self, arg):
         return arg[1]
+    def __iter__(self):
+        d = self._tdict
+        v0 = self._version
+        for arg in d._els:
+            if d._version > v0:
+                raise RuntimeError(f"{type(self)} changed during iteration")
+            yield arg[1][1]
     def __contains__(self, v):
-        for (kv,_) in self._els:
-            if kv[1] == v:
+        d = self._tdict
+        v0 = self._version
+        for arg in d._els:
+            if d._version > v0:
+                raise RuntimeError(f"{type(self)} changed during iteration")
+            x = arg[1][1]
+            if x is v or x == v:
                 return True
         return False
 class tdict(TransientMapping):
@@ -372,19 +674,24 @@ class tdict(TransientMapping):
     efficient by reducing the number of allocations required.
     """
     @classmethod
-    def _new(cls, els, idx, top, orig=None):
+    def _new(cls, els, idx, top, orig=None, hashcode=None):
+        # The hashcode is tracked only if it is known (by default, if the
+        # original pdict has already been hashed).
+        if hashcode is None and orig is not None:
+            hashcode = orig._hashcode
         new_tdict = super(tdict, cls).__new__(cls)
-        object.__setattr__(new_tdict, '_els', els)
-        object.__setattr__(new_tdict, '_idx', idx)
-        object.__setattr__(new_tdict, '_top', top)
-        object.__setattr__(new_tdict, '_version', 0)
-        object.__setattr__(new_tdict, '_orig', orig)
+        _tdict_set_els(new_tdict, els)
+        _tdict_set_idx(new_tdict, idx)
+        _tdict_set_top(new_tdict, top)
+        _tdict_set_version(new_tdict, 0)
+        _tdict_set_orig(new_tdict, orig)
+        _tdict_set_hashcode(new_tdict, hashcode)
         return new_tdict
     @classmethod
     def empty(cls):
         """Returns an empty tdict."""
         return cls._new(THAMT(PHAMT.empty), THAMT(PHAMT.empty), 0)
-    __slots__ = ("_els", "_idx", "_top","_version")
+    __slots__ = ("_els", "_idx", "_top", "_version", "_orig", "_hashcode")
     def __new__(cls, *args, **kw):
         n = len(args)
         if n == 1:
@@ -402,12 +709,13 @@ class tdict(TransientMapping):
             obj = cls._new(THAMT(arg._els.persistent()),
                            THAMT(arg._idx.persistent()),
                            arg._top,
-                           arg._orig)
+                           arg._orig,
+                           arg._hashcode)
         elif isinstance(arg, pdict):
             obj = cls._new(THAMT(arg._els), THAMT(arg._idx), arg._top, arg)
         else:
             obj = cls._new(THAMT(PHAMT.empty), THAMT(PHAMT.empty), 0)
-            if isinstance(arg, Mapping):
+            if type(arg) is dict or isinstance(arg, Mapping):
                 arg = arg.items()
             for (k,v) in arg:
                 obj[k] = v
@@ -419,111 +727,140 @@ class tdict(TransientMapping):
     def __setattr__(self, k, v):
         raise TypeError("tdict attributes are immutable")
     def __setitem__(self, k, v):
-        # Get the hash and initial index (if there is one).
+        # Get the hash and the entry for it (if there is one).
         h = hash(k)
-        ii = self._idx.get(h, None)
-        # First make sure it's not already in the dict.
-        ii_prev = None
-        while ii is not None:
-            (kv, ii_next) = self._els[ii]
-            if kv[0] == k:
+        idx = self._idx
+        ent = idx.get(h, None)
+        top = self._top
+        if ent is None:
+            # The object's hash is not here yet, so we can append to els and
+            # insert it into idx.
+            kv = (k, v)
+            idx[h] = (top, kv)
+        else:
+            if type(ent) is tuple:
+                pos = 0 if k is ent[1][0] or k == ent[1][0] else None
+            else:
+                pos = _bucket_find(ent, k)
+            if pos is not None:
+                (ii,kv) = ent if type(ent) is tuple else ent[pos]
                 if kv[1] is not v:
-                    self._els[ii] = ((k,v), ii_next)
+                    # Like dict, we keep the original key object.
+                    (old_kv, kv) = (kv, (kv[0], v))
+                    hc = self._hashcode
+                    if hc is not None:
+                        _tdict_set_hashcode(self, _hash_update(hc, old_kv, kv))
+                    self._els[ii] = kv
+                    if type(ent) is tuple:
+                        idx[h] = (ii, kv)
+                    else:
+                        idx[h] = _bucket(ent[:pos] + ((ii, kv),) + ent[pos+1:])
                     # The object has changed, so make sure we aren't tracking
                     # the original object still.
-                    object.__setattr__(self, '_orig', None)
+                    if self._orig is not None:
+                        _tdict_set_orig(self, None)
                 # Note that this does not mandate a version update because it is
                 # not changing the keys.
                 return None
-            ii_prev = ii
-            kv_prev = kv
-            ii = ii_next
-        if ii_prev is None:
-            # The object's hash is not here yet, so we can append to els and
-            # insert it into idx.
-            self._els[self._top] = ((k,v), None)
-            self._idx[h] = self._top
-        else:
-            # If we reach this point, we can add the object to the end of the
-            # list.
-            self._els[self._top] = ((k,v), None)
-            self._els[ii_prev] = (kv_prev, self._top)
-        object.__setattr__(self, '_top', self._top + 1)
-        object.__setattr__(self, '_version', self._version + 1)
-        object.__setattr__(self, '_orig', None)
+            # If we reach this point, we have a new hash collision, and the
+            # entry must be added to the (possibly new) bucket.
+            kv = (k, v)
+            if type(ent) is tuple:
+                idx[h] = _bucket((ent, (top, kv)))
+            else:
+                idx[h] = _bucket(ent + ((top, kv),))
+        self._els[top] = kv
+        hc = self._hashcode
+        if hc is not None:
+            _tdict_set_hashcode(self, _hash_update(hc, None, kv))
+        _tdict_set_top(self, top + 1)
+        _tdict_set_version(self, self._version + 1)
+        if self._orig is not None:
+            _tdict_set_orig(self, None)
     def __len__(self):
         return len(self._els)
     def __contains__(self, k):
-        h = hash(k)
-        ii = self._idx.get(h, None)
-        while ii is not None:
-            ((kk,vv),ii) = self._els[ii]
-            if k == kk:
-                return True
-        return False
+        ent = self._idx.get(hash(k), None)
+        if ent is None:
+            return False
+        elif type(ent) is tuple:
+            k0 = ent[1][0]
+            return k is k0 or k == k0
+        else:
+            return _bucket_find(ent, k) is not None
     def __reversed__(self):
         return reversed(self.keys())
     def __getitem__(self, key):
-        h = hash(key)
-        ii = self._idx.get(h, None)
-        while ii is not None:
-            (kv,ii) = self._els[ii]
-            if key == kv[0]:
-                return kv[1]
+        ent = self._idx.get(hash(key), None)
+        if ent is not None:
+            if type(ent) is tuple:
+                kv = ent[1]
+                if key is kv[0] or key == kv[0]:
+                    return kv[1]
+            else:
+                for (ii,kv) in ent:
+                    if key is kv[0] or key == kv[0]:
+                        return kv[1]
         raise KeyError(key)
     def get(self, key, default=None):
-        h = hash(key)
-        ii = self._idx.get(h, None)
-        while ii is not None:
-            (kv,ii) = self._els[ii]
-            if key == kv[0]:
-                return kv[1]
+        ent = self._idx.get(hash(key), None)
+        if ent is not None:
+            if type(ent) is tuple:
+                kv = ent[1]
+                if key is kv[0] or key == kv[0]:
+                    return kv[1]
+            else:
+                for (ii,kv) in ent:
+                    if key is kv[0] or key == kv[0]:
+                        return kv[1]
         return default
-    def __iter__(self):
-        v0 = self._version
-        def _iter_key(arg):
+    def _iter_keys(self, els_iter, v0):
+        for arg in els_iter:
             if v0 < self._version:
                 raise RuntimeError(f"{type(self)} changed during iteration")
-            else:
-                return arg[1][0][0]
-        return map(_iter_key, self._els)
+            yield arg[1][0]
+    def __iter__(self):
+        # The version and the iterator over els are taken now rather than when
+        # the generator first runs.
+        return self._iter_keys(iter(self._els), self._version)
+    def _remove(self, h, ent, pos):
+        # Removes the entry at position pos of the idx entry ent (which is
+        # stored under the hash h) and returns the removed (key, value) pair.
+        if type(ent) is tuple:
+            (ii,kv) = ent
+            del self._idx[h]
+        else:
+            (ii,kv) = ent[pos]
+            self._idx[h] = _bucket_drop(ent, pos)
+        del self._els[ii]
+        hc = self._hashcode
+        if hc is not None:
+            _tdict_set_hashcode(self, hc ^ hash(kv))
+        _tdict_set_version(self, self._version + 1)
+        if self._orig is not None:
+            _tdict_set_orig(self, None)
+        return kv
     def __delitem__(self, key):
-        # Get the hash and initial index (if there is one).
+        # Get the hash and the entry for it (if there is one).
         h = hash(key)
-        ii = self._idx.get(h, None)
-        # First make sure it's not already in the set.
-        ii_prev = None
-        kv_prev = None
-        while ii is not None:
-            (kv,ii_next) = self._els[ii]
-            (k,v) = kv
-            if key == k:
-                # We remove this entry!
-                if ii_prev is None:
-                    # We're removing from the front of the list.
-                    if ii_next is None:
-                        del self._idx[h]
-                    else:
-                        self._idx[h] = ii_next
-                else:
-                    # We're removing from the end or the middle.
-                    self._els[ii_prev] = (kv_prev, ii_next)
-                del self._els[ii]
-                object.__setattr__(self, '_version', self._version + 1)
-                object.__setattr__(self, '_orig', None)
-                return None
-            ii_prev = ii
-            kv_prev = kv
-            ii = ii_next
-        # If we reach this point, then obj isn't in the set, so we just return
-        # self unchanged.
-        raise KeyError(key)
+        ent = self._idx.get(h, None)
+        if ent is None:
+            pos = None
+        elif type(ent) is tuple:
+            pos = 0 if key is ent[1][0] or key == ent[1][0] else None
+        else:
+            pos = _bucket_find(ent, key)
+        if pos is None:
+            raise KeyError(key)
+        self._remove(h, ent, pos)
     def clear(self):
         """Returns the empty pdict."""
-        object.__setattr__(self, '_els', THAMT(PHAMT.empty))
-        object.__setattr__(self, '_idx', THAMT(PHAMT.empty))
-        object.__setattr__(self, '_top', 0)
-        object.__setattr__(self, '_version', 0)
+        _tdict_set_els(self, THAMT(PHAMT.empty))
+        _tdict_set_idx(self, THAMT(PHAMT.empty))
+        _tdict_set_top(self, 0)
+        _tdict_set_version(self, 0)
+        _tdict_set_orig(self, None)
+        _tdict_set_hashcode(self, 0)
         return None
     def pop(self, key, *args):
         """Removes the given key from the tdict and returns the previously
@@ -536,35 +873,40 @@ class tdict(TransientMapping):
         if nargs > 1:
             raise TypeError(f"pop expected at most 2 arguments, got {nargs}")
         h = hash(key)
-        ii = self._idx.get(h, None)
-        ii_prev = None
-        kv_prev = None
-        while ii is not None:
-            (kv,ii_next) = self._els[ii]
-            (k,v) = kv
-            if key == k:
-                # We remove this entry!
-                if ii_prev is None:
-                    # We're removing from the front of the list.
-                    if ii_next is None:
-                        del self._idx[h]
-                    else:
-                        self._idx[h] = ii_next
-                else:
-                    # We're removing from the end or the middle.
-                    self._els[ii_prev] = (kv_prev, ii_next)
-                del self._els[ii]
-                object.__setattr__(self, '_version', self._version + 1)
-                object.__setattr__(self, '_orig', None)
-                return v
-            ii_prev = ii
-            kv_prev = kv
-            ii = ii_next
+        ent = self._idx.get(h, None)
+        if ent is None:
+            pos = None
+        elif type(ent) is tuple:
+            pos = 0 if key is ent[1][0] or key == ent[1][0] else None
+        else:
+            pos = _bucket_find(ent, key)
+        if pos is not None:
+            return self._remove(h, ent, pos)[1]
         # It's not here!
         if nargs == 0:
             raise KeyError(key)
         else:
             return args[0]
+    def discard(self, key):
+        """Removes the given key from the tdict, if it is present, without
+        reading its value.
+
+        Returns `True` if the key was removed and `False` if it was not found.
+        """
+        h = hash(key)
+        ent = self._idx.get(h, None)
+        if ent is None:
+            return False
+        elif type(ent) is tuple:
+            if not (key is ent[1][0] or key == ent[1][0]):
+                return False
+            pos = 0
+        else:
+            pos = _bucket_find(ent, key)
+            if pos is None:
+                return False
+        self._remove(h, ent, pos)
+        return True
     def persistent(self):
         """Efficiently returns a persistent (pdict) copy of the tdict."""
         if len(self) == 0:
@@ -574,10 +916,18 @@ class tdict(TransientMapping):
         else:
             return pdict._new(self._els.persistent(),
                               self._idx.persistent(),
-                              self._top)
+                              self._top,
+                              self._hashcode)
     def keys(self):
         return tdict_keys(self)
     def items(self):
         return tdict_items(self)
     def values(self):
         return tdict_values(self)
+# Setters for the tdict slots (see the pdict slot setters above).
+_tdict_set_els = tdict._els.__set__
+_tdict_set_idx = tdict._idx.__set__
+_tdict_set_top = tdict._top.__set__
+_tdict_set_version = tdict._version.__set__
+_tdict_set_orig = tdict._orig.__set__
+_tdict_set_hashcode = tdict._hashcode.__set__
@@ -15,10 +15,12 @@ from ._list import (
     tlist
 )
 from ._dict import (
+    PDictView,
     pdict_items,
     pdict_values,
     pdict,
     tdict,
+    tdict_view,
     tdict_items,
     tdict_values
 )
@@ -36,7 +38,8 @@ class LazyError(RuntimeError):
     def __init__(self, partial):
         self.partial = partial
     def __str__(self):
-        if isinstance(self.partial, partial):
+        p = self.partial
+        if isinstance(p, partial):
             (fn, args, kwargs) = (p.func, p.args, p.keywords)
         else:
             (fn, args, kwargs) = self.partial
@@ -59,55 +62,77 @@ class lazy:
 
     `l = lazy(fn, *args, **kwargs)` stores the given callable `fn` with the
     given `args` and `kwargs` as arguments. When the lazy value of `l` is later
-    requested (via `l()`), the value is cached, and the partial data is
-    forgotten.
+    requested (via `l()`), the value is cached, and the function and its
+    arguments are forgotten.
+
+    The `lazy` type should not be subclassed: the lazy collections recognize
+    lazy values by checking `type(x) is lazy`.
+
+    By default, `lazy` objects do not lock while calculating their values, so
+    if two threads request an uncached value at the same time, the function
+    may be called by both (and either result may be cached). If the class
+    attribute `lazy.thread_safe` is set to `True`, then all `lazy` objects
+    created afterwards allocate a lock that ensures their function is called
+    only once.
     """
-    __slots__ = ('partial', 'value')
+    __slots__ = ('_fn', '_args', '_kw', 'value', '_lock')
+    thread_safe = False
     def __new__(cls, fn, *args, **kw):
         # Make sure the function is callable.
         if not callable(fn):
             raise TypeError(f"lazy({fn}) must be given a callable function")
         # Allocate an object.
         obj = object.__new__(cls)
-        # Create the partial object.
-        part = partial(fn, *args, **kw)
-        # We want to prepare an error to raise if something happens during the
-        # calculation of the lazy value in the __call__ method.
-        try:
-            raise LazyError((fn, args, kw))
-        except LazyError as e:
-            error = e
-        # Set the appropriate members.
-        object.__setattr__(obj, 'partial', (part, RLock(), error))
-        # We set value to an RLock for use in the calculation.
+        # Set the appropriate members; the function and its arguments are
+        # stored directly rather than in a partial object.
+        object.__setattr__(obj, '_fn', fn)
+        object.__setattr__(obj, '_args', args)
+        object.__setattr__(obj, '_kw', kw)
         object.__setattr__(obj, 'value', None)
+        object.__setattr__(obj, '_lock', RLock() if cls.thread_safe else None)
         # That's all that is needed.
         return obj
     def __call__(self):
-        part = self.partial
-        if part is None:
+        fn = self._fn
+        if fn is None:
             return self.value
-        else:
-            (part, rlock, init_error) = part
-            # Acquire the rlock then re-check that the lazy hasn't already been
-            # calculated (at which point self.partial will be None).
-            rlock.acquire()
-            try:
-                if self.partial is None:
-                    val = self.value
-                else:
-                    val = part()
-                    # We've successfully calculated the value; set the members
-                    # appropriately.
-                    object.__setattr__(self, 'value', val)
-                    object.__setattr__(self, 'partial', None)
-                return val
-            except Exception as partial_eror:
-                # If an exception occurs, we want to raise an error that traces
-                # back to the initialization of this object.
-                raise init_error
-            finally:
-                rlock.release()
+        rlock = self._lock
+        if rlock is None:
+            return self._calculate(fn)
+        # Acquire the rlock then re-check that the lazy hasn't already been
+        # calculated (at which point self._fn will be None).
+        rlock.acquire()
+        try:
+            if self._fn is None:
+                return self.value
+            else:
+                return self._calculate(fn)
+        finally:
+            rlock.release()
+    def _calculate(self, fn):
+        # Calculates and caches the value by calling fn; if an exception occurs,
+        # a LazyError is raised instead.
+        (args, kw) = (self._args, self._kw)
+        # The arguments are cleared after _fn, so if they have been cleared
+        # by another thread then the value is already cached.
+        if self._fn is None:
+            return self.value
+        try:
+            val = fn(*args, **kw)
+        except Exception:
+            # If an exception occurs, we raise a LazyError describing the call;
+            # the original exception is attached as its context. (The error is
+            # only constructed here so that lazy objects that never fail don't
+            # pay for it.)
+            raise LazyError((fn, args, kw))
+        # We've successfully calculated the value; set the members
+        # appropriately. The value must be set before _fn is cleared, since
+        # readers don't take the lock.
+        object.__setattr__(self, 'value', val)
+        object.__setattr__(self, '_fn', None)
+        object.__setattr__(self, '_args', None)
+        object.__setattr__(self, '_kw', None)
+        return val
     def __repr__(self):
         s = 'ready' if self.is_ready() else 'waiting'
         return f"lazy(<{id(self)}>: {s})"
@@ -122,22 +147,22 @@ class lazy:
             `True` if the given lazy object has cached its value and `False`
             otherwise.
         """
-        return self.partial is None
+        return self._fn is None
 def unlazy(obj):
     """Returns the cached value of a lazy object or the object if not lazy."""
-    if isinstance(obj, lazy):
+    if type(obj) is lazy:
        return obj()
     else:
        return obj
 def reprlazy(obj):
     """Returns `'<lazy>'` if `obj` is a `lazy` object, otherwise `repr(obj)`."""
-    if isinstance(obj, lazy):
+    if type(obj) is lazy:
         return "<lazy>"
     else:
         return repr(obj)
 def strlazy(obj):
     """Returns `'<lazy>'` if `obj` is a `lazy` object, otherwise `str(obj)`."""
-    if isinstance(obj, lazy):
+    if type(obj) is lazy:
         return "<lazy>"
     else:
         return str(obj)
@@ -197,11 +222,12 @@ class llist(plist):
     empty = None
     __slots__ = ()
     def __iter__(self):
-        it = plist.__iter__(self)
-        return map(lambda u: u() if isinstance(u, lazy) else u, it)
+        return map(unlazy, plist.__iter__(self))
+    def __reversed__(self):
+        return map(unlazy, plist.__reversed__(self))
     def __getitem__(self, k):
         el = plist.__getitem__(self, k)
-        return el() if isinstance(el, lazy) else el
+        return el() if type(el) is lazy else el
     def __str__(self):
         # We have a max length of 60 characters, not counting the delimiters.
         return f"[|{seqstr(self.as_plist(), maxlen=60, tostr=reprlazy)}|]"
@@ -216,7 +242,7 @@ class llist(plist):
         method.
         """
         v = plist.__getitem__(self, index)
-        return isinstance(v, lazy)
+        return type(v) is lazy
     def is_ready(self, index):
         """Determines if the given key's value can be immediately returned.
 
@@ -224,14 +250,14 @@ class llist(plist):
         non-`lazy` value or is mapped to a `lazy` value that is cached.
         """
         v = plist.__getitem__(self, index)
-        if isinstance(v, lazy):
+        if type(v) is lazy:
             return v.is_ready()
         else:
             return True
     def ready_all(self):
         "Caches all lazy items then returns the list."
-        for el in self._phamt:
-            if isinstance(el, lazy):
+        for (ii,el) in self._phamt:
+            if type(el) is lazy and el._fn is not None:
                 el()
         return self
     def as_plist(self):
@@ -273,6 +299,8 @@ class tllist(tlist):
     __slots__ = ()
     def __iter__(self):
         return map(unlazy, tlist.__iter__(self))
+    def __reversed__(self):
+        return map(unlazy, tlist.__reversed__(self))
     def persistent(self):
         """Efficiently copies the tllist into an llist and returns the llist."""
         if len(self._thamt) == 0:
@@ -282,7 +310,8 @@ class tllist(tlist):
         else:
             return self._orig
     def __getitem__(self, k):
-        return unlazy(tlist.__getitem__(self, k))
+        v = tlist.__getitem__(self, k)
+        return v() if type(v) is lazy else v
     def getlazy(self, k):
         """Returns an element of the list without dereferecing lazy elements."""
         return tlist.__getitem__(self, k)
@@ -294,17 +323,24 @@ class tllist(tlist):
 
 class ldict_items(pdict_items):
     __slots__ = ()
+    __iter__ = PDictView.__iter__
     def _from_kv(self, kv):
         (k,v) = kv
-        if isinstance(v, lazy):
+        if type(v) is lazy:
             return (k, v())
         else:
             return kv
 class ldict_values(pdict_values):
     __slots__ = ()
+    __iter__ = PDictView.__iter__
+    def __contains__(self, v):
+        for arg in self._mapping._els:
+            if self._from_kv(arg[1]) == v:
+                return True
+        return False
     def _from_kv(self, kv):
         v = kv[1]
-        if isinstance(v, lazy):
+        if type(v) is lazy:
             v = v()
         return v
 class ldict(pdict):
@@ -329,7 +365,7 @@ class ldict(pdict):
     __slots__ = ()
     def __getitem__(self, key):
         v = pdict.__getitem__(self, key)
-        if isinstance(v, lazy):
+        if type(v) is lazy:
             v = v()
         return v
     def __str__(self):
@@ -339,9 +375,14 @@ class ldict(pdict):
         return f"{{|{seqstr(self.as_pdict())}|}}"
     def get(self, key, default=None):
         v = pdict.get(self, key, default)
-        if isinstance(v, lazy):
+        if type(v) is lazy:
             v = v()
         return v
+    def pop(self, key, *args):
+        (v, d) = pdict.pop(self, key, *args)
+        if type(v) is lazy:
+            v = v()
+        return (v, d)
     def items(self):
         return ldict_items(self)
     def values(self):
@@ -355,7 +396,7 @@ class ldict(pdict):
         method.
         """
         v = pdict.__getitem__(self, index)
-        return isinstance(v, lazy)
+        return type(v) is lazy
     def is_ready(self, index):
         """Determines if the given key's value can be immediately returned.
 
@@ -363,15 +404,15 @@ class ldict(pdict):
         non-`lazy` value or is mapped to a `lazy` value that is cached.
         """
         v = pdict.__getitem__(self, index)
-        if isinstance(v, lazy):
+        if type(v) is lazy:
             return v.is_ready()
         else:
             return True
     def ready_all(self):
         "Caches all lazy items then returns the dictionary."
-        for arg in self._els:
-            (k,v) = arg[1][0]
-            if isinstance(v, lazy):
+        for (ii,kv) in self._els:
+            v = kv[1]
+            if type(v) is lazy and v._fn is not None:
                 v()
         return self
     def as_pdict(self):
@@ -383,7 +424,8 @@ class ldict(pdict):
         mapped to their associated `lazy` objects. This is essentially a way to
         expose the raw values of a lazy dictionary.
         """
-        return pdict._new(self._els, self._idx, self._top)
+        return pdict._new(self._els, self._idx, self._top,
+                          self._hashcode, self._small)
     def __holdlazy__(self):
         return self.as_pdict()
     def getlazy(self, key, default=None):
@@ -400,28 +442,41 @@ class ldict(pdict):
     def transient(self):
         return tldict._new(THAMT(self._els), THAMT(self._idx), self._top, self)
 # Make the empty pdict.
-ldict.empty = ldict._new(PHAMT.empty, PHAMT.empty, 0)
+ldict.empty = ldict._new(PHAMT.empty, PHAMT.empty, 0, 0)
 
 # The Transient Lazy Dictionary Type -------------------------------------------
 class tldict_items(tdict_items):
     __slots__ = ()
+    __iter__ = tdict_view.__iter__
     def _from_kv(self, kv):
-        if isinstance(kv[1], lazy):
+        if type(kv[1]) is lazy:
             return (kv[0], kv[1]())
         else:
             return kv
 class tldict_values(tdict_values):
     __slots__ = ()
+    __iter__ = tdict_view.__iter__
     def _from_kv(self, arg):
         return unlazy(arg[1])
     def __contains__(self, v):
-        for (kv,_) in self._els:
-            if not isinstance(kv[1], lazy):
-                if kv[1] == v:
-                    return True
-        for (kv,_) in self._els:
-            if isinstance(kv[1], lazy):
-                if kv[1]() == v:
+        # We check the non-lazy values first and only evaluate the lazy values
+        # (which we collect as we go) if none of them match.
+        d = self._tdict
+        v0 = self._version
+        pending = None
+        for arg in d._els:
+            if d._version > v0:
+                raise RuntimeError(f"{type(self)} changed during iteration")
+            u = arg[1][1]
+            if type(u) is lazy:
+                if pending is None:
+                    pending = []
+                pending.append(u)
+            elif u == v:
+                return True
+        if pending is not None:
+            for u in pending:
+                if u() == v:
                     return True
         return False
 class tldict(tdict):
@@ -441,13 +496,17 @@ class tldict(tdict):
         else:
             return ldict._new(self._els.persistent(),
                               self._idx.persistent(),
-                              self._top)
+                              self._top,
+                              self._hashcode)
     def __getitem__(self, k):
-        return unlazy(tdict.__getitem__(self, k))
+        v = tdict.__getitem__(self, k)
+        return v() if type(v) is lazy else v
     def get(self, k, default=None):
-        return unlazy(tdict.get(self, k, default))
+        v = tdict.get(self, k, default)
+        return v() if type(v) is lazy else v
     def pop(self, *args):
-        return unlazy(self.pop(*args))
+        v = tdict.pop(self, *args)
+        return v() if type(v) is lazy else v
     def items(self):
         return tldict_items(self)
     def values(self):
@@ -4,12 +4,35 @@
 # The persistent list type for Python.
 # By Noah C. Benson
 
-from itertools import (chain, islice)
+from collections.abc import Sized
+from itertools import (chain, islice, repeat)
+from numbers import Integral
+from operator import itemgetter
 
 from phamt import (PHAMT,THAMT)
 
 from .abc import (PersistentSequence, TransientSequence)
 
+# Iterating over a PHAMT yields (index, value) pairs; this extracts the values.
+_second = itemgetter(1)
+
+# Reverse iteration looks up this many elements by index before it switches to
+# copying the remaining values out in a single forward pass; this way a partial
+# reverse iteration stays cheap while a full one avoids n index lookups.
+_REVERSED_LOOKUPS = 32
+def _reversed_values(seq, getitem, forward):
+    """Yields the elements of the plist or tlist `seq` in reverse order.
+
+    `getitem` and `forward` are the (unbound) `__getitem__` and `__iter__`
+    methods to use for the index lookups and for the forward pass.
+    """
+    n = len(seq)
+    k = min(n, _REVERSED_LOOKUPS)
+    for ii in range(n - 1, n - k - 1, -1):
+        yield getitem(seq, ii)
+    if k < n:
+        yield from reversed(list(islice(forward(seq), n - k)))
+
 
 #===============================================================================
 # plist
@@ -22,7 +45,7 @@ class plist(PersistentSequence):
     `plist(iterable)` returns a `plist` containing the elements in `iterable`.
     """
     empty = None
-    __slots__ = ("_phamt", "_start", "_hashcode")
+    __slots__ = ("_phamt", "_start", "_len", "_hashcode")
     def __new__(cls, *args, **kw):
         if len(kw) > 0:
             raise TypeError(f"{cls.__name__}() takes no keyword arguments")
@@ -33,8 +56,15 @@ class plist(PersistentSequence):
             msg = f"{cls.__name__} expects at most 1 argument, got {n}"
             raise TypeError(msg)
         arg = args[0]
+        # We check for exact types first because the isinstance checks below
+        # go through the (comparatively slow) ABC machinery.
+        argtype = type(arg)
+        if argtype is cls:
+            return arg
+        elif argtype is list or argtype is tuple:
+            pass
         # If arg is a tlist, this is a special case.
-        if isinstance(arg, tlist):
+        elif isinstance(arg, tlist):
             if len(arg) == 0:
                 return cls.empty
             else:
@@ -45,12 +75,9 @@ class plist(PersistentSequence):
             if len(arg) == 0:
                 return cls.empty
             else:
-                return cls._new(arg._phamt, arg._start)        
+                return cls._new(arg._phamt, arg._start)
         # We just want to build a PHAMT out of this arg of iterables.
-        thamt = THAMT(PHAMT.empty)
-        for (ii,val) in enumerate(iter(arg)):
-            thamt[ii] = val
-        phamt = thamt.persistent()
+        phamt = PHAMT.from_iter(arg)
         # If it's empty, we can just return the empty plist.
         if len(phamt) == 0: return cls.empty
         # Otherwise, we make a new plist and give it this phamt.
@@ -60,6 +87,7 @@ class plist(PersistentSequence):
         new_plist = super(plist, cls).__new__(cls)
         object.__setattr__(new_plist, '_phamt', phamt)
         object.__setattr__(new_plist, '_start', start)
+        object.__setattr__(new_plist, '_len', len(phamt))
         object.__setattr__(new_plist, '_hashcode', None)
         return new_plist
     def set(self, index, obj):
@@ -67,7 +95,7 @@ class plist(PersistentSequence):
         object."""
         start = self._start
         phamt = self._phamt
-        n = len(phamt)
+        n = self._len
         if index < -n or index >= n:
             raise IndexError("plist index out of range")
         if index < 0:
@@ -81,7 +109,7 @@ class plist(PersistentSequence):
         """"Returns a copy of the plist with the item at index removed (default
         index: last)."""
         phamt = self._phamt
-        n = len(phamt)
+        n = self._len
         st = self._start
         if n == 0:
             raise IndexError("delete from empty plist")
@@ -100,47 +128,47 @@ class plist(PersistentSequence):
         # Other cases require moving elements around a fair bit, so we use a
         # THAMT object.
         thamt = THAMT(phamt)
+        # We bind these methods once for the shift loops below.
+        (getel, setel) = (phamt.__getitem__, thamt.__setitem__)
         if n - index <= index:
             for ii in range(index + st, n + st - 1):
-                thamt[ii] = phamt[ii + 1]
+                setel(ii, getel(ii + 1))
             del thamt[n + st - 1]
         else:
             for ii in range(st, index + st):
-                thamt[ii + 1] = phamt[ii]
+                setel(ii + 1, getel(ii))
             del thamt[st]
             st += 1
         return self._new(thamt.persistent(), st)
     def append(self, obj):
         """Returns a new list with object appended."""
-        phamt = self._phamt
-        n = len(phamt)
-        new_phamt = phamt.assoc(self._start + n, obj)
-        return self._new(new_phamt, self._start)
+        start = self._start
+        new_phamt = self._phamt.assoc(start + self._len, obj)
+        return self._new(new_phamt, start)
     def prepend(self, obj):
         """Returns a new list with object prepended."""
-        phamt = self._phamt
-        n = len(phamt)
         new_start = self._start - 1
-        new_phamt = phamt.assoc(new_start, obj)
+        new_phamt = self._phamt.assoc(new_start, obj)
         return self._new(new_phamt, new_start)
     def insert(self, index, obj):
         """Returns a new plist with object inserted before index."""
         start = self._start
         phamt = self._phamt
-        n = len(phamt)
+        n = self._len
         if   index == 0: return self.prepend(obj)
         elif index == n: return self.append(obj)
         elif index < -n: index = -n
         elif index > n:  index = n
         if   index < 0:  index += n
         thamt = THAMT(phamt)
+        (getel, setel) = (phamt.__getitem__, thamt.__setitem__)
         if n - index <= index:
             for ii in range(index + start, n + start):
-                thamt[ii + 1] = phamt[ii]
+                setel(ii + 1, getel(ii))
             thamt[index + start] = obj
         else:
             for ii in range(start, index + start):
-                thamt[ii - 1] = phamt[ii]
+                setel(ii - 1, getel(ii))
             start -= 1
             thamt[index + start] = obj
         phamt = thamt.persistent()
@@ -150,44 +178,91 @@ class plist(PersistentSequence):
         return plist.empty
     def __iter__(self):
         phamt = self._phamt
-        n = len(phamt)
         st = self._start
-        if st >= 0 or n + st < 0:
-            return map(lambda u:u[1], self._phamt)
+        # Lists that have never been prepended to have a start of 0, so we
+        # check that first.
+        npos = self._len + st
+        if st >= 0 or npos <= 0:
+            return map(_second, phamt)
         else:
-            from itertools import chain, islice
-            return chain((phamt[k] for k in range(st, 0)),
-                         islice(map(lambda u:u[1], phamt), 0, n + st))
+            # The PHAMT yields the non-negative keys first, so we look up the
+            # negative keys directly then iterate over the non-negative keys.
+            return chain(map(phamt.__getitem__, range(st, 0)),
+                         islice(map(_second, phamt), npos))
+    def __reversed__(self):
+        # The PHAMT can only be walked forward; see _reversed_values.
+        return _reversed_values(self, plist.__getitem__, plist.__iter__)
     def __len__(self):
         """Returns the length of the plist."""
-        return len(self._phamt)
+        return self._len
     def __getitem__(self, k):
         st = self._start
         phamt = self._phamt
-        n = len(phamt)
+        n = self._len
         if isinstance(k, slice):
-            (start,stop,step) = (k.start or 0, k.stop or n, k.step or 1)
-            if   start <= -n: start = 0
-            elif start < 0:   start += n
-            elif start > n:   start = n
-            if   stop <= -n: stop = 0
-            elif stop < 0:   stop += n
-            elif stop > n:   stop = n
-            if st != 0:
-                start += st
-                stop += st
-            thamt = THAMT(PHAMT.empty)
-            for (ii,jj) in enumerate(range(start, stop, step)):
-                thamt[ii] = phamt[jj]
-            return self._new(thamt.persistent(), 0)
+            (start,stop,step) = k.indices(n)
+            idcs = range(start + st, stop + st, step)
+            return self._new(PHAMT.from_iter(map(phamt.__getitem__, idcs)), 0)
         elif k >= n or k < -n:
             raise IndexError("plist index out of range")
         elif k < 0:
             k += n
         return phamt[k + st]
+    def extend(self, iterable):
+        """Returns a new plist with the elements of the iterable appended."""
+        if not isinstance(iterable, Sized):
+            iterable = list(iterable)
+        m = len(iterable)
+        if m == 0:
+            return self
+        elif m < 2*self._len:
+            # Shorter extensions are appended via a transient, which shares
+            # most of the trie with this plist.
+            return PersistentSequence.extend(self, iterable)
+        # Otherwise, building the combined trie in bulk is faster.
+        phamt = PHAMT.from_iter(chain(plist.__iter__(self), iterable))
+        return self._new(phamt, 0)
+    def __add__(self, obj):
+        if type(obj) is type(self) and 2*self._len < obj._len:
+            # A short plist followed by a long one is prepended onto the long
+            # one so that the result shares most of its trie.
+            if self._len == 0:
+                return obj
+            t = obj.transient()
+            prepend = t.prepend
+            for el in plist.__reversed__(self):
+                prepend(el)
+            return self._from_transient(t)
+        return PersistentSequence.__add__(self, obj)
+    def __mul__(self, value):
+        if not isinstance(value, Integral):
+            msg = f"can't multiply sequence by non-int of type '{type(value)}'"
+            raise ValueError(msg)
+        reps = int(value)
+        if reps <= 0:
+            return self.clear()
+        elif reps == 1:
+            return self
+        # We read the stored values once (via plist.__iter__ so that lazy
+        # subclasses don't evaluate anything) then build the result in bulk.
+        els = tuple(plist.__iter__(self))
+        phamt = PHAMT.from_iter(chain.from_iterable(repeat(els, reps)))
+        return self._new(phamt, 0)
+    def __rmul__(self, value):
+        return self.__mul__(value)
     def transient(self):
         """Efficiently copes the plist into a tlist and returns the tlist."""
         return tlist._new(THAMT(self._phamt), self._start, self)
+    def __eq__(self, other):
+        if isinstance(other, plist):
+            # Lists that share a trie and a start are equal, and lists whose
+            # cached hashes differ can't be.
+            if self._phamt is other._phamt and self._start == other._start:
+                return True
+            (h1, h2) = (self._hashcode, other._hashcode)
+            if h1 is not None and h2 is not None and h1 != h2:
+                return False
+        return PersistentSequence.__eq__(self, other)
     # We redefine the hash function in order to use the _hashcode member.
     def __hash__(self):
         if self._hashcode is None:
@@ -228,12 +303,10 @@ class tlist(TransientSequence):
         else: raise TypeError(f"tlist expects at most 1 argument, got {n}")
         arg = args[0]
         # If this is a plist, we know what to do with it.
-        if isinstance(arg, plist):
+        if type(arg) is plist or isinstance(arg, plist):
             return cls._new(THAMT(arg._phamt), arg._start)
         # We just want to build a THAMT out of this arg of iterables.
-        thamt = THAMT(PHAMT.empty)
-        for (ii,val) in enumerate(iter(arg)):
-            thamt[ii] = val
+        thamt = THAMT(PHAMT.from_iter(arg))
         # We make a new tlist and give it this phamt.
         return cls._new(thamt, 0)
     @classmethod
@@ -245,9 +318,9 @@ class tlist(TransientSequence):
         return new_tlist
     def clear(self):
         """Clears all elements from the tlist."""
-        object.__setattr__(self, '_thamt', THAMT(PHAMT.empty))
-        object.__setattr__(self, '_start', 0)
-        object.__setattr__(self, '_orig', None)
+        self._thamt = THAMT(PHAMT.empty)
+        self._start = 0
+        self._orig = None
     def persistent(self):
         """Efficiently copies the tlist into a plist and returns the plist."""
         if len(self._thamt) == 0:
@@ -259,12 +332,16 @@ class tlist(TransientSequence):
     def __iter__(self):
         st = self._start
         th = self._thamt
-        n = len(th)
-        if st >= 0 or n + st < 0:
-            return map(lambda u:u[1], iter(th))
+        npos = len(th) + st
+        if st >= 0 or npos <= 0:
+            return map(_second, th)
         else:
-            return chain((th[k] for k in range(st, 0)),
-                         islice(map(lambda u:u[1], iter(th)), 0, n + st))
+            # See plist.__iter__.
+            return chain(map(th.__getitem__, range(st, 0)),
+                         islice(map(_second, th), npos))
+    def __reversed__(self):
+        # See plist.__reversed__.
+        return _reversed_values(self, tlist.__getitem__, tlist.__iter__)
     def __len__(self):
         """Returns the length of the tlist."""
         return len(self._thamt)
@@ -273,33 +350,25 @@ class tlist(TransientSequence):
         thamt = self._thamt
         n = len(thamt)
         if isinstance(k, slice):
-            (start,stop,step) = (k.start or 0, k.stop or n, k.step or 1)
-            if   start <= -n: start = 0
-            elif start < 0:   start += n
-            elif start > n:   start = n
-            if   stop <= -n: stop = 0
-            elif stop < 0:   stop += n
-            elif stop > n:   stop = n
-            if st != 0:
-                start += st
-                stop += st
-            new_thamt = THAMT(PHAMT.empty)
-            for (ii,jj) in enumerate(range(start, stop, step)):
-                new_thamt[ii] = thamt[jj]
-            return self._new(new_thamt, 0)
+            (start,stop,step) = k.indices(n)
+            idcs = range(start + st, stop + st, step)
+            els = PHAMT.from_iter(map(thamt.__getitem__, idcs))
+            return self._new(THAMT(els), 0)
         elif k >= n or k < -n:
             raise IndexError("tlist index out of range")
         elif k < 0:
             k += n
         return thamt[k + st]
     def __setitem__(self, k, v):
-        n = len(self._thamt)
+        thamt = self._thamt
+        n = len(thamt)
         if k >= n or k < -n:
             raise IndexError(k)
         elif k < 0:
             k += n
-        self._thamt[k + self._start] = v
-        object.__setattr__(self, '_orig', None)
+        thamt[k + self._start] = v
+        if self._orig is not None:
+            self._orig = None
     def __delitem__(self, index=-1):
         """Remove and return item at index (default last).
 
@@ -311,29 +380,54 @@ class tlist(TransientSequence):
             raise IndexError(f"{type(self)} assignment index out of range")
         elif index < 0:
             index += n
+        (getel, setel) = (th.__getitem__, th.__setitem__)
         if n - index <= index:
             for ii in range(index + st, n + st - 1):
-                th[ii] = th[ii + 1]
+                setel(ii, getel(ii + 1))
             del th[n + st - 1]
         else:
             for ii in range(index + st, st, -1):
-                th[ii] = th[ii - 1]
+                setel(ii, getel(ii - 1))
             del th[st]
-            self._start += 1
-        object.__setattr__(self, '_orig', None)
+            self._start = st + 1
+        if self._orig is not None:
+            self._orig = None
     def append(self, obj):
         """Appends object to the end of the list."""
         thamt = self._thamt
-        n = len(thamt)
-        thamt[n + self._start] = obj
-        object.__setattr__(self, '_orig', None)
+        thamt[len(thamt) + self._start] = obj
+        if self._orig is not None:
+            self._orig = None
+    def extend(self, iterable):
+        """Extends tlist by appending elements from the iterable."""
+        if iterable is self:
+            iterable = list(iterable)
+        th = self._thamt
+        n = len(th)
+        if n == 0:
+            # An empty tlist can be rebuilt from the iterable in bulk.
+            th = THAMT(PHAMT.from_iter(iterable))
+            if len(th) == 0:
+                return
+            self._thamt = th
+            self._start = 0
+        else:
+            # Otherwise, we write the new elements directly into the trie
+            # rather than paying for a call to append for each of them.
+            setel = th.__setitem__
+            for (k,el) in enumerate(iterable, n + self._start):
+                setel(k, el)
+            if len(th) == n:
+                return
+        if self._orig is not None:
+            self._orig = None
     def prepend(self, obj):
         """Prepends object to the beginning of the tlist."""
-        thamt = self._thamt
-        n = len(thamt)
-        self._start -= 1
-        thamt[self._start] = obj
-        object.__setattr__(self, '_orig', None)
+        st = self._start - 1
+        self._thamt[st] = obj
+        self._start = st
+        if self._orig is not None:
+            self._orig = None
     def insert(self, index, obj):
         """Inserts the given object before the given index."""
         st = self._start
@@ -342,13 +436,16 @@ class tlist(TransientSequence):
         if   index < -n: index = -n
         elif index > n:  index = n
         if   index < 0:  index += n
+        (getel, setel) = (th.__getitem__, th.__setitem__)
         if n - index <= index:
             for ii in range(n + st, index + st, -1):
-                th[ii] = th[ii - 1]
+                setel(ii, getel(ii - 1))
             th[index + st] = obj
         else:
             for ii in range(st - 1, index + st - 1):
-                th[ii] = th[ii + 1]
-            self._start -= 1
-            th[index + self._start] = obj
-        object.__setattr__(self, '_orig', None)
+                setel(ii, getel(ii + 1))
+            st -= 1
+            th[index + st] = obj
+            self._start = st
+        if self._orig is not None:
+            self._orig = None
@@ -4,10 +4,62 @@
 # The persistent set type for Python.
 # By Noah C. Benson
 
+from sys      import hash_info
+from operator import itemgetter
+
 from phamt import (PHAMT,THAMT)
 
-from .abc  import (PersistentSet, TransientSet)
-from .util import (setcmp)
+from .abc   import (PersistentSet, TransientSet)
+from .util  import (setcmp)
+from ._dict import (_bucket, _bucket_drop)
+
+# Iterating over a PHAMT yields (index, value) pairs; this extracts the values.
+_second = itemgetter(1)
+
+
+#===============================================================================
+# Collision Buckets
+# Both pset and tset store a PHAMT (_idx) that maps hash(obj) to an entry
+# (index, obj), where index is the object's position in the PHAMT of
+# insertion-ordered objects (_els). When two objects share a hash, the entry is
+# instead a _bucket of such entries (see also _dict.py).
+
+def _bucket_find(bucket, obj):
+    """Returns the position in `bucket` of the entry for `obj` or `None`."""
+    for (pos, ent) in enumerate(bucket):
+        if obj == ent[1]:
+            return pos
+    return None
+
+
+#===============================================================================
+# Incremental Hashing
+# The hash of a pset follows the algorithm CPython uses for frozenset: the
+# element hashes are scrambled and XOR'ed together, then the result is mixed
+# with the set's size. The XOR'ed part (which a pset or tset keeps in its
+# _hashcode slot) is independent of order, so once it is known (i.e., once the
+# set has been hashed) it can be updated in constant time whenever an element
+# is added or discarded. Until then, _hashcode is None and isn't maintained.
+
+_HASH_BITS = hash_info.width
+_HASH_MASK = (1 << _HASH_BITS) - 1
+def _shuffle_bits(h):
+    """Returns the scrambled form of the element hash `h` that gets XOR'ed into
+    a set's hash accumulator."""
+    h &= _HASH_MASK
+    return (((h ^ 89869747) ^ (h << 16)) * 3644798167) & _HASH_MASK
+def _set_hash(acc, n):
+    """Returns the hash of a set of `n` elements whose hash accumulator (the
+    XOR of their shuffled hashes) is `acc`."""
+    h = acc ^ (((n + 1) * 1927868237) & _HASH_MASK)
+    h ^= (h >> 11) ^ (h >> 25)
+    h = (h * 69069 + 907133923) & _HASH_MASK
+    if h == _HASH_MASK:
+        return 590923713
+    elif h >> (_HASH_BITS - 1):
+        return h - (1 << _HASH_BITS)
+    else:
+        return h
 
 
 #===============================================================================
@@ -27,12 +79,12 @@ class pset(PersistentSet):
     """
     empty = None
     @classmethod
-    def _new(cls, els, idx, top):
+    def _new(cls, els, idx, top, hashcode):
         new_pset = super(pset, cls).__new__(cls)
         object.__setattr__(new_pset, '_els', els)
         object.__setattr__(new_pset, '_idx', idx)
         object.__setattr__(new_pset, '_top', top)
-        object.__setattr__(new_pset, '_hashcode', None)
+        object.__setattr__(new_pset, '_hashcode', hashcode)
         return new_pset
     __slots__ = ("_els", "_idx", "_top", "_hashcode")
     def __new__(cls, *args, **kw):
@@ -45,14 +97,22 @@ class pset(PersistentSet):
             return pset.empty
         else:
             raise TypeError(f"pset expects at most 1 argument, got {n}")
+        # We check for exact types first because the isinstance checks below
+        # go through the (comparatively slow) ABC machinery.
+        argtype = type(arg)
+        if argtype is cls:
+            return arg
         # If arg is a tset, this is a special case.
-        if isinstance(arg, tset):
+        if argtype is tset or isinstance(arg, tset):
             if len(arg) == 0:
                 return cls.empty
+            elif type(arg._orig) is cls:
+                return arg._orig
             else:
                 return cls._new(arg._els.persistent(),
                                 arg._idx.persistent(),
-                                arg._top)
+                                arg._top,
+                                arg._hashcode)
         # If it's a pset, we can just return it as-is.
         if isinstance(arg, pset):
             return arg
@@ -61,87 +121,83 @@ class pset(PersistentSet):
     def __len__(self):
         return len(self._els)
     def __contains__(self, el):
-        h = hash(el)
-        ii = self._idx.get(h, None)
-        while ii is not None:
-            (x,ii) = self._els[ii]
-            if el == x:
-                return True
-        return False
+        ent = self._idx.get(hash(el), None)
+        if ent is None:
+            return False
+        elif type(ent) is _bucket:
+            return _bucket_find(ent, el) is not None
+        else:
+            return el == ent[1]
     def __iter__(self):
-        return map(lambda u: u[1][0], self._els)
+        return map(_second, self._els)
     def __hash__(self):
-        if self._hashcode is None:
-            h = PersistentSet.__hash__(self)
-            object.__setattr__(self, '_hashcode', h)
-        return self._hashcode
+        acc = self._hashcode
+        if acc is None:
+            acc = 0
+            for el in self._els:
+                acc ^= _shuffle_bits(hash(el[1]))
+            object.__setattr__(self, '_hashcode', acc)
+        return _set_hash(acc, len(self._els)) + 1
     def transient(self):
         """Returns a transient copy of the set in constant time."""
-        return tset._new(THAMT(self._els), THAMT(self._idx), self._top, self)
+        return tset._new(THAMT(self._els), THAMT(self._idx), self._top,
+                         self._hashcode, self)
     def add(self, obj):
         """Returns a copy of the pset that includes the given object."""
-        # Get the hash and initial index (if there is one).
         h = hash(obj)
-        ii = self._idx.get(h, None)
-        if ii is None:
-            # The object's hash is not here yet, so we can append to els and
-            # insert it into idx.
-            new_els = self._els.assoc(self._top, (obj, None))
-            new_idx = self._idx.assoc(h, self._top)
+        idx = self._idx
+        top = self._top
+        ent = idx.get(h, None)
+        new_ent = (top, obj)
+        if ent is None:
+            pass
+        elif type(ent) is _bucket:
+            if _bucket_find(ent, obj) is not None:
+                return self
+            new_ent = _bucket(ent + (new_ent,))
+        elif obj == ent[1]:
+            return self
         else:
-            # First make sure it's not already in the set.
-            ii_prev = None
-            while ii is not None:
-                (x,ii_next) = self._els[ii]
-                if obj == x:
-                    return self
-                ii_prev = ii
-                x_prev = x
-                ii = ii_next
-            # If we reach this point, we can add the object to the end of the
-            # list.
-            new_els = self._els.assoc(self._top, (obj, None))
-            new_els = new_els.assoc(ii_prev, (x_prev, self._top))
-        return self._new(new_els, new_idx, self._top + 1)
+            # A hash collision: both entries go into a bucket.
+            new_ent = _bucket((ent, new_ent))
+        new_els = self._els.assoc(top, obj)
+        hc = self._hashcode
+        if hc is not None:
+            hc ^= _shuffle_bits(h)
+        return self._new(new_els, idx.assoc(h, new_ent), top + 1, hc)
     def discard(self, obj):
         """Returns a copy of the pset that does not include the given object.
 
         If the element is not a member, `discard` returns the original pset.
         """
-        # Get the hash and initial index (if there is one).
         h = hash(obj)
-        ii = self._idx.get(h, None)
-        # First make sure it's not already in the set.
-        ii_prev = None
-        x_prev = None
-        while ii is not None:
-            (x,ii_next) = self._els[ii]
-            if obj == x:
-                # We remove this object!
-                if ii_prev is None:
-                    # We're removing from the front of the list.
-                    if ii_next is None:
-                        new_idx = self._idx.dissoc(h)
-                    else:
-                        new_idx = self._idx.assoc(h, ii_next)
-                    new_els = self._els
-                else:
-                    # We're removing from the end or the middle.
-                    new_idx = self._idx
-                    new_els = self._els.assoc(ii_prev, (x_prev, ii_next))
-                new_els = new_els.dissoc(ii)
-                return self._new(new_els, new_idx, self._top)
-            ii_prev = ii
-            x_prev = x
-            ii = ii_next
-        # If we reach this point, then obj isn't in the set, so we just return
-        # self unchanged.
-        return self
+        idx = self._idx
+        ent = idx.get(h, None)
+        if ent is None:
+            return self
+        elif type(ent) is _bucket:
+            pos = _bucket_find(ent, obj)
+            if pos is None:
+                return self
+            ii = ent[pos][0]
+            new_idx = idx.assoc(h, _bucket_drop(ent, pos))
+        elif obj == ent[1]:
+            ii = ent[0]
+            new_idx = idx.dissoc(h)
+        else:
+            return self
+        els = self._els
+        if len(els) == 1:
+            return pset.empty
+        hc = self._hashcode
+        if hc is not None:
+            hc ^= _shuffle_bits(h)
+        return self._new(els.dissoc(ii), new_idx, self._top, hc)
     def clear(self):
         """Returns the empty pset."""
         return pset.empty
 # Make the empty pset.
-pset.empty = pset._new(PHAMT.empty, PHAMT.empty, 0)
+pset.empty = pset._new(PHAMT.empty, PHAMT.empty, 0, None)
 
 
 #===============================================================================
@@ -162,18 +218,19 @@ class tset(TransientSet):
     changes such as the inclusion of an additional element.
     """
     @classmethod
-    def _new(cls, els, idx, top, orig=None):
+    def _new(cls, els, idx, top, hashcode, orig=None):
         new_tset = super(tset, cls).__new__(cls)
         object.__setattr__(new_tset, '_els', els)
         object.__setattr__(new_tset, '_idx', idx)
         object.__setattr__(new_tset, '_top', top)
+        object.__setattr__(new_tset, '_hashcode', hashcode)
         object.__setattr__(new_tset, '_orig', orig)
         return new_tset
     @classmethod
     def empty(cls):
         """Returns an empty tset."""
-        return cls._new(THAMT(PHAMT.empty), THAMT(PHAMT.empty), 0)
-    __slots__ = ("_els", "_idx", "_top", "_orig")
+        return cls._new(THAMT(PHAMT.empty), THAMT(PHAMT.empty), 0, None)
+    __slots__ = ("_els", "_idx", "_top", "_hashcode", "_orig")
     def __new__(cls, *args, **kw):
         if len(kw) > 0:
             raise TypeError("tset() takes no keyword arguments")
@@ -186,8 +243,9 @@ class tset(TransientSet):
             raise TypeError(f"tset expects at most 1 argument, got {n}")
         arg = args[0]
         # If arg is a pset, this is a special case.
-        if isinstance(arg, pset):
-            return cls._new(THAMT(arg._els), THAMT(arg._idx), arg._top)
+        if type(arg) is pset or isinstance(arg, pset):
+            return cls._new(THAMT(arg._els), THAMT(arg._idx), arg._top,
+                            arg._hashcode)
         # For anything else, however, we just build up.
         t = cls.empty()
         t.addall(arg)
@@ -195,81 +253,75 @@ class tset(TransientSet):
     def __len__(self):
         return len(self._els)
     def __contains__(self, el):
-        h = hash(el)
-        ii = self._idx.get(h, None)
-        while ii is not None:
-            (x,ii) = self._els[ii]
-            if el == x:
-                return True
-        return False
+        ent = self._idx.get(hash(el), None)
+        if ent is None:
+            return False
+        elif type(ent) is _bucket:
+            return _bucket_find(ent, el) is not None
+        else:
+            return el == ent[1]
     def __iter__(self):
-        return map(lambda u: u[1][0], self._els)
+        return map(_second, self._els)
     def add(self, obj):
-        """Returns a copy of the tset that includes the given object."""
-        # Get the hash and initial index (if there is one).
+        """Adds the given object to the tset."""
         h = hash(obj)
-        ii_first = self._idx.get(h, None)
-        if ii_first is None:
-            # The object's hash is not here yet, so we can append to els and
-            # insert it into idx.
-            self._els[self._top] = (obj, None)
-            self._idx[h] = self._top
+        idx = self._idx
+        top = self._top
+        ent = idx.get(h, None)
+        new_ent = (top, obj)
+        if ent is None:
+            pass
+        elif type(ent) is _bucket:
+            if _bucket_find(ent, obj) is not None:
+                return None
+            new_ent = _bucket(ent + (new_ent,))
+        elif obj == ent[1]:
+            return None
         else:
-            # First make sure it's not already in the set.
-            ii = ii_first
-            ii_prev = None
-            while ii is not None:
-                (x,ii_next) = self._els[ii]
-                if obj == x:
-                    return None
-                ii_prev = ii
-                x_prev = x
-                ii = ii_next
-            # If we reach this point, we can add the object to the end of the
-            # list.
-            self._els[self._top] = (obj, None)
-            self._els[ii_prev] = (x_prev, self._top)
-        object.__setattr__(self, '_top', self._top + 1)
-        object.__setattr__(self, '_orig', None)
+            # A hash collision: both entries go into a bucket.
+            new_ent = _bucket((ent, new_ent))
+        self._els[top] = obj
+        idx[h] = new_ent
+        self._top = top + 1
+        hc = self._hashcode
+        if hc is not None:
+            self._hashcode = hc ^ _shuffle_bits(h)
+        if self._orig is not None:
+            self._orig = None
     def discard(self, obj):
         """Discards the given object from the set.
 
         If the element is not a member, `discard` simply returns.
         """
-        # Get the hash and initial index (if there is one).
         h = hash(obj)
-        ii = self._idx.get(h, None)
-        # First make sure it's not already in the set.
-        ii_prev = None
-        x_prev = None
-        while ii is not None:
-            (x,ii_next) = self._els[ii]
-            if obj == x:
-                # We remove this object!
-                if ii_prev is None:
-                    # We're removing from the front of the list.
-                    if ii_next is None:
-                        del self._idx[h]
-                    else:
-                        self._idx[h] = ii_next
-                    del self._els[ii]
-                else:
-                    # We're removing from the end or the middle.
-                    del self._els[ii]
-                    self._els[ii_prev] = (x_prev, ii_next)
-                object.__setattr__(self, '_orig', None)
+        idx = self._idx
+        ent = idx.get(h, None)
+        if ent is None:
+            return None
+        elif type(ent) is _bucket:
+            pos = _bucket_find(ent, obj)
+            if pos is None:
                 return None
-            ii_prev = ii
-            x_prev = x
-            ii = ii_next
-        # If we reach this point, then obj isn't in the set, so we just return.
-        return None
+            ii = ent[pos][0]
+            idx[h] = _bucket_drop(ent, pos)
+        elif obj == ent[1]:
+            ii = ent[0]
+            del idx[h]
+        else:
+            return None
+        del self._els[ii]
+        hc = self._hashcode
+        if hc is not None:
+            self._hashcode = hc ^ _shuffle_bits(h)
+        if self._orig is not None:
+            self._orig = None
     def clear(self):
         """Clears the tset."""
-        object.__setattr__(self, '_els', THAMT(PHAMT.empty))
-        object.__setattr__(self, '_idx', THAMT(PHAMT.empty))
-        object.__setattr__(self, '_top', 0)
-        object.__setattr__(self, '_orig', None)
+        self._els = THAMT(PHAMT.empty)
+        self._idx = THAMT(PHAMT.empty)
+        self._top = 0
+        self._hashcode = None
+        self._orig = None
     def persistent(self):
         """Efficiently returns a persistent set that is a copy of the tset."""
         if len(self) == 0:
@@ -277,7 +329,8 @@ class tset(TransientSet):
         elif self._orig is None:
             return pset._new(self._els.persistent(),
                              self._idx.persistent(),
-                             self._top)
+                             self._top,
+                             self._hashcode)
         else:
             return self._orig
 
@@ -7,6 +7,9 @@
 from collections.abc import Hashable
 
 class Persistent(Hashable):
+    # Persistent types declare their own slots; none of the abstract bases
+    # have instance dictionaries, so we declare the weakref slot here.
+    __slots__ = ('__weakref__',)
     # Abstract methods.
     def transient(self):
         """Efficiently returns a transient copy of the persistent object."""
@@ -23,8 +26,15 @@ class Persistent(Hashable):
         """Returns the persistent object (persistent objects needn't be
         copied)."""
         return self
+    def _from_transient(self, t):
+        """Returns the transient `t` as a persistent object of the same type as
+        the persistent object (which may be a subclass of `t`'s persistent
+        type)."""
+        p = t.persistent()
+        return p if type(p) is type(self) else type(self)(t)
 
 class Transient:
+    __slots__ = ('__weakref__',)
     def persistent(self):
         """Efficiently returns a persistent copy of the transient object."""
         raise NotImplementedError()
@@ -4,12 +4,17 @@
 # The definitions of the abstract base classes for the pcollections dict types.
 # By Noah C. Benson
 
-from collections.abc import (Mapping, MutableMapping)
+from json            import (dumps)
+from collections.abc import (Mapping, MutableMapping, Sized)
 
 from ._core import (Persistent, Transient)
 from ..util import (seqstr)
 
 
+# A sentinel for values that are not in a mapping.
+_absent = object()
+
+
 #===============================================================================
 # PersistentMapping
 
@@ -62,6 +67,7 @@ class PersistentMapping(Mapping, Persistent):
      * `__reduce__` (for pickling)
      * `__json__` (for `json_fix` module)
     """
+    __slots__ = ()
     # Methods which must be implemented in the children.
     def set(self, key, val):
         """Returns a copy of the pdict that maps the given key to the given
@@ -85,13 +91,9 @@ class PersistentMapping(Mapping, Persistent):
     def __repr__(self):
         return f"{{|{seqstr(self)}|}}"
     def __hash__(self):
-        return hash(frozenset(map(lambda u: u[1][0], self._els))) + 2
+        return hash(frozenset(self.items())) + 2
     def __contains__(self, k):
-        try:
-            self[k]
-            return True
-        except KeyError:
-            return False
+        return self.get(k, _absent) is not _absent
     def get(self, key, default=None):
         try:
             return self[key]
@@ -111,9 +113,10 @@ class PersistentMapping(Mapping, Persistent):
         in the given iterables of keys and values.
         """
         t = self.transient()
+        setitem = t.__setitem__
         for (k,v) in zip(keys, vals):
-            t[k] = v
-        return type(self)(t)
+            setitem(k, v)
+        return self._from_transient(t)
     def dropall(self, keys):
         """Returns a copy of the persistent mapping that excludes all the keys
         in the given iterable.
@@ -121,9 +124,11 @@ class PersistentMapping(Mapping, Persistent):
         Keys that are not found in the mapping are ignored.
         """
         t = self.transient()
+        # We don't use pop here because lazy mappings would evaluate the value.
+        discard = t.discard
         for k in keys:
-            t.drop(k)
-        return type(self)(t)
+            discard(k)
+        return self._from_transient(t)
     def deleteall(self, keys):
         """Returns a copy of the persistent mapping that excludes all the keys
         in the given iterable.
@@ -131,9 +136,10 @@ class PersistentMapping(Mapping, Persistent):
         If any key is not found in the mapping, then a KeyError error is raised.
         """
         t = self.transient()
+        delitem = t.__delitem__
         for k in keys:
-            del t[k]
-        return type(self)(t)
+            delitem(k)
+        return self._from_transient(t)
     def setdefault(self, key, default=None):
         """Returns a copy of the persistent mapping with the key inserted with a
         value of default, if key is not already in the mapping.
@@ -160,15 +166,14 @@ class PersistentMapping(Mapping, Persistent):
         nargs = len(args)
         if nargs > 1:
             raise TypeError(f"pop expected at most 2 arguments, got {nargs}")
-        try:
-            val = self[key]
+        val = self.get(key, _absent)
+        if val is not _absent:
             return (val, self.drop(key))
-        except KeyError:
-            # It's not here!
-            if nargs == 0:
-                raise
-            else:
-                return (args[0], self)
+        # It's not here!
+        if nargs == 0:
+            raise KeyError(key)
+        else:
+            return (args[0], self)
     def update(self, *args, **kw):
         """Returns a copy of the persistent mapping with the key-value pairs in
         the iterable/mapping `arg` and the keyword arguments included.
@@ -176,18 +181,26 @@ class PersistentMapping(Mapping, Persistent):
         Multiple arguments may be provided, but they must each be a mapping or
         an iterable of items.
         """
+        if not kw and all(isinstance(arg, Sized) and len(arg) == 0
+                          for arg in args):
+            return self
         t = self.transient()
+        setitem = t.__setitem__
         for arg in args:
-            for (k,v) in (arg.items() if isinstance(arg, Mapping) else arg):
-                t[k] = v
+            # We check for dict first because isinstance checks against ABCs
+            # are comparatively slow.
+            if type(arg) is dict or isinstance(arg, Mapping):
+                arg = arg.items()
+            for (k,v) in arg:
+                setitem(k, v)
         for (k,v) in kw.items():
-            t[k] = v
-        return type(self)(t)
+            setitem(k, v)
+        return self._from_transient(t)
     def __reduce__(self):
-        return (self.__new__, (type(self), list(self.items()),))
+        # A dict pickles compactly, and the constructor bulk-loads dicts.
+        return (type(self), (dict(self.items()),))
     def __json__(self):
-        from json import dumps
-        return dumps(dict(self))
+        return dumps(dict(self.items()))
 
 
 #===============================================================================
@@ -228,11 +241,13 @@ class TransientMapping(MutableMapping, Transient):
      * `setdefault(key, default=None)` (`MutableMapping`)
      * `popitem()` (`MutableMapping`)
      * `pop()` (`MutableMapping`)
+     * `discard(key)`
      * `update(map, **kw)` (`MutableMapping`)
      * `copy()` (`Transient`)
      * `__reduce__` (for pickling)
      * `__json__` (for the `json_fix` module)
     """
+    __slots__ = ()
     # Methods which must be implemented in the children.
     def clear(self):
         """Returns the empty persistent mapping of the same type."""
@@ -242,15 +257,9 @@ class TransientMapping(MutableMapping, Transient):
         # We have a max length of 60 characters, not counting the delimiters.
         return f"{{<{seqstr(self, maxlen=60)}>}}"
     def __repr__(self):
-        #s = repr(dict(self))
-        #return f"{{<{s[1:-1]}>}}"
         return f"{{|{seqstr(self)}|}}"
     def __contains__(self, k):
-        try:
-            self[k]
-            return True
-        except KeyError:
-            return False
+        return self.get(k, _absent) is not _absent
     def get(self, key, default=None):
         try:
             return self[key]
@@ -261,10 +270,9 @@ class TransientMapping(MutableMapping, Transient):
 
         Return the value for the key if key is in the dictionary, else default.
         """
-        try:
-            return self[key]
-        except KeyError:
-            pass
+        val = self.get(key, _absent)
+        if val is not _absent:
+            return val
         self[key] = default
         return default
     def popitem(self):
@@ -286,16 +294,26 @@ class TransientMapping(MutableMapping, Transient):
         nargs = len(args)
         if nargs > 1:
             raise TypeError(f"pop expected at most 2 arguments, got {nargs}")
-        try:
-            val = self[key]
+        val = self.get(key, _absent)
+        if val is not _absent:
             del self[key]
             return val
-        except KeyError:
-            # It's not here!
-            if nargs == 0:
-                raise
-            else:
-                return args[0]
+        # It's not here!
+        if nargs == 0:
+            raise KeyError(key)
+        else:
+            return args[0]
+    def discard(self, key):
+        """Removes the given key from the transient mapping, if it is present,
+        without reading its value.
+
+        Returns `True` if the key was removed and `False` if it was not found.
+        """
+        if key in self:
+            del self[key]
+            return True
+        else:
+            return False
     def update(self, *args, **kw):
         """Updates the transient mapping with items from the arguments and
         options.
@@ -303,18 +321,23 @@ class TransientMapping(MutableMapping, Transient):
         Multiple arguments may be provided, but they must each be either a
         mapping or an iterable of items.
         """
+        setitem = self.__setitem__
         for arg in args:
-            for (k,v) in (arg.items() if isinstance(arg, Mapping) else arg):
-                self[k] = v
+            # We check for dict first because isinstance checks against ABCs
+            # are comparatively slow.
+            if type(arg) is dict or isinstance(arg, Mapping):
+                arg = arg.items()
+            for (k,v) in arg:
+                setitem(k, v)
         for (k,v) in kw.items():
-            self[k] = v
+            setitem(k, v)
     def copy(self):
         """Returns a copy of the transient mapping."""
         return self.persistent().transient()
     # The below handle pickling cases.
     def __reduce__(self):
-        return (self.__new__, (type(self), list(self.items()),))
+        # A dict pickles compactly, and the constructor bulk-loads dicts.
+        return (type(self), (dict(self.items()),))
     def __json__(self):
-        from json import dumps
-        return dumps(dict(self))
+        return dumps(dict(self.items()))
         
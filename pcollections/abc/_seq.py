@@ -6,6 +6,9 @@
 # By Noah C. Benson
 
 from numbers         import (Integral)
+from itertools       import (chain, islice, repeat)
+from operator        import (countOf, indexOf)
+from json            import (dumps)
 from collections.abc import (Sequence, MutableSequence)
 
 from ._core import (Persistent, Transient)
@@ -62,6 +65,7 @@ class PersistentSequence(Persistent, Sequence):
      * `reverse()`
      * `__json__` (for `json_fix` module)
     """
+    __slots__ = ()
     # Methods which must be implemented in the children.
     def set(self, index, obj):
         """Returns a copy of the persistent sequence with the given index set to
@@ -114,21 +118,19 @@ class PersistentSequence(Persistent, Sequence):
     def sort(self, key=None, reverse=False):
         """Returns a sorted copy of the given persistent sequence."""
         t = self.clear().transient()
-        for k in sorted(self, key=key, reverse=reverse):
-            t.append(k)
-        return type(self)(t)
+        t.extend(sorted(self, key=key, reverse=reverse))
+        return self._from_transient(t)
     def reverse(self):
         """Returns a plist that is a reversed copy."""
+        # Reversing a list snapshot runs in C; the result is then loaded in
+        # bulk rather than looked up one index at a time.
         t = self.clear().transient()
-        for el in self.__reversed__():
-            t.append(el)
-        return type(self)(t)
+        t.extend(list(self)[::-1])
+        return self._from_transient(t)
     def __str__(self):
         # We have a max length of 60 characters, not counting the delimiters.
         return f"[|{seqstr(self, maxlen=60)}|]"
     def __repr__(self):
-        #s = repr(list(self))
-        #return f"[|{s[1:-1]}|]"
         return f"[|{seqstr(self)}|]"
     _eq_types = ()
     def __eq__(self, other):
@@ -136,8 +138,14 @@ class PersistentSequence(Persistent, Sequence):
             return True
         elif not isinstance(other, PersistentSequence._eq_types):
             return False
-        else:
-            return seqcmp(self, other) == 0
+        elif len(self) != len(other):
+            return False
+        # Like list, we check identity before equality for each element; we
+        # don't use seqcmp here because elements needn't be orderable.
+        for (a,b) in zip(self, other):
+            if not (a is b or a == b):
+                return False
+        return True
     def __lt__(self, other):
         if not isinstance(other, (list, PersistentSequence, TransientSequence)):
             raise TypeError(f"'<' not supported between instances of"
@@ -158,52 +166,42 @@ class PersistentSequence(Persistent, Sequence):
             raise TypeError(f"'>=' not supported between instances of"
                             f" '{type(self)}' and '{type(other)}'")
         return seqcmp(self, other) >= 0
+    # The hash is computed from scratch on each call; subclasses with storage
+    # for it should cache the result (see plist._hashcode).
     def __hash__(self):
         return hash(tuple(self)) + 1
     def __contains__(self, value):
-        for el in self:
-            if el == value:
-                return True
-        return False
+        # Membership tests on an iterator run in C (checking identity first).
+        return value in iter(self)
     def __reversed__(self):
         n = len(self)
         return map(self.__getitem__, range(n - 1, -1, -1))
     def count(self, value):
         """Returns the number of occurences of value."""
-        n = 0
-        for (k,obj) in self._phamt:
-            if obj == value: n += 1
-        return n
+        return countOf(self, value)
     def extend(self, iterable):
         """Return a new persistent sequence with the iterables appended."""
         t = self.transient()
+        append = t.append
         for el in iterable:
-            t.append(el)
-        return type(self)(t)
+            append(el)
+        return self._from_transient(t)
     def index(self, value, start=0, stop=None):
         """Returns first index of value.
 
         Raises ValueError if value is not present.
         """
-        if stop is None:
-            stop = len(self)
-        if start == 0:
-            for (ii,val) in enumerate(self):
-                if ii >= stop:
-                    break
-                elif val == value:
-                    return ii
+        (start,stop,_) = slice(start, stop).indices(len(self))
+        if 3*(stop - start) < start:
+            # Looking up a short range far from the front is faster than
+            # iterating past all of the elements that precede it.
+            els = map(self.__getitem__, range(start, stop))
         else:
-            for (ii,val) in enumerate(self):
-                if ii >= stop:
-                    break
-                elif ii < start:
-                    pass
-                elif val == value:
-                    return ii
-        raise ValueError(f"{value} is not in {type(self)}")
-    # We include a hash function; though this should be overwritten to cache the
-    # hash-code due to it's slowness.
+            els = islice(self, start, stop)
+        try:
+            return start + indexOf(els, value)
+        except ValueError:
+            raise ValueError(f"{value} is not in {type(self)}") from None
     def __add__(self, obj):
         if not isinstance(obj, (list, PersistentSequence)):
             msg = (f"unsuppoorted operand type for +:"
@@ -228,9 +226,10 @@ class PersistentSequence(Persistent, Sequence):
             return obj
         else:
             t = self.transient()
+            prepend = t.prepend
             for el in reversed(obj):
-                t.prepend(el)
-            return type(self)(t)
+                prepend(el)
+            return self._from_transient(t)
     def __mul__(self, value):
         if not isinstance(value, Integral):
             msg = f"can't multiply sequence by non-int of type '{type(value)}'"
@@ -242,18 +241,17 @@ class PersistentSequence(Persistent, Sequence):
             return self.clear()
         elif reps == 1:
             return self
+        # We read the elements once, then append them in a single pass.
+        els = list(self)
         t = self.transient()
-        for r in range(reps - 1):
-            for el in self:
-                t.append(el)
-        return type(self)(t)
+        t.extend(chain.from_iterable(repeat(els, reps - 1)))
+        return self._from_transient(t)
     def __rmul__(self, value):
         return self.__mul__(value)
     # For pickling:
     def __reduce__(self):
         return (self.__new__, (type(self), list(self),))
     def __json__(self):
-        from json import dumps
         return dumps(list(self))
 
 
@@ -307,6 +305,7 @@ class TransientSequence(Transient, MutableSequence):
      * `__reduce__` (for pickling)
      * `__json__` (for `json_fix` module)
     """
+    __slots__ = ()
     def pop(self, index=-1):
         """Remove and return item at index (default last).
 
@@ -332,35 +331,23 @@ class TransientSequence(Transient, MutableSequence):
 
         The reverse flag can be set to sort in descending order.
         """
-        for (ii,el) in enumerate(sorted(self, key=key, reverse=reverse)):
-            t[ii] = el
+        els = sorted(self, key=key, reverse=reverse)
+        self.clear()
+        self.extend(els)
     def count(self, value):
         """Returns the number of occurences of value."""
-        n = 0
-        for obj in self:
-            if obj == value: n += 1
-        return n
+        return countOf(self, value)
     def extend(self, iterable):
         """Extends tlist by appending elements from the iterable."""
+        append = self.append
         for val in iterable:
-            self.append(val)
-    def index(self, value, start=0, stop=None):
-        """Returns the first index of value.
-
-        Raises ValueError if value is not present.
-        """
-        for (ii,el) in enumerate(self):
-            if value == el:
-                return ii
-        raise ValueError(f'{value} is not in {type(self)}')
+            append(val)
     def reverse(self):
         """Reverses *IN PLACE*."""
-        n = len(self)
-        for k in range(n//2):
-            kk = n - k
-            tmp = self[k]
-            self[k] = self[kk]
-            self[kk] = tmp
+        els = list(self)
+        els.reverse()
+        self.clear()
+        self.extend(els)
     def __str__(self):
         # We have a max length of 60 characters, not counting the delimiters.
         return f"[<{seqstr(self, maxlen=60)}>]"
@@ -374,8 +361,10 @@ class TransientSequence(Transient, MutableSequence):
             return False
         elif len(self) != len(other):
             return False
-        else:
-            return seqcmp(self, other) == 0
+        for (a,b) in zip(self, other):
+            if not (a is b or a == b):
+                return False
+        return True
     def __lt__(self, other):
         if not isinstance(other, (list, PersistentSequence, TransientSequence)):
             raise TypeError(f"'<' not supported between instances of"
@@ -397,43 +386,27 @@ class TransientSequence(Transient, MutableSequence):
                             f" '{type(self)}' and '{type(other)}'")
         return seqcmp(self, other) >= 0
     def __contains__(self, value):
-        for el in self:
-            if el == value:
-                return True
-        return False
+        # Membership tests on an iterator run in C (checking identity first).
+        return value in iter(self)
     def __reversed__(self):
         n = len(self)
         return map(self.__getitem__, range(n - 1, -1, -1))
-    def count(self, value):
-        """Returns the number of occurences of value."""
-        n = 0
-        for (k,obj) in self._phamt:
-            if obj == value: n += 1
-        return n
-    def extend(self, iterable):
-        """Return a new persistent sequence with the iterables appended."""
-        for el in iterable:
-            self.append(el)
     def index(self, value, start=0, stop=None):
         """Returns first index of value.
 
         Raises ValueError if value is not present.
         """
-        if start == 0:
-            for (ii,val) in enumerate(self):
-                if ii >= stop:
-                    break
-                elif val == value:
-                    return ii
+        (start,stop,_) = slice(start, stop).indices(len(self))
+        if 3*(stop - start) < start:
+            # Looking up a short range far from the front is faster than
+            # iterating past all of the elements that precede it.
+            els = map(self.__getitem__, range(start, stop))
         else:
-            for (ii,val) in enumerate(self):
-                if ii >= stop:
-                    break
-                elif ii < start:
-                    pass
-                elif val == value:
-                    return ii
-        raise ValueError(f"{value} is not in {type(self)}")
+            els = islice(self, start, stop)
+        try:
+            return start + indexOf(els, value)
+        except ValueError:
+            raise ValueError(f"{value} is not in {type(self)}") from None
     def __iadd__(self, obj):
         if not isinstance(obj, (list, PersistentSequence, TransientSequence)):
             msg = (f"unsuppoorted operand type for +=:"
@@ -461,9 +434,10 @@ class TransientSequence(Transient, MutableSequence):
             return self.copy()
         else:
             t = self.copy()
+            prepend = t.prepend
             for el in reversed(obj):
-                t.prepend(el)
-            return r
+                prepend(el)
+            return t
     def __imul__(self, value):
         if not isinstance(value, Integral):
             msg = f"can't multiply sequence by non-int of type '{type(value)}'"
@@ -474,13 +448,10 @@ class TransientSequence(Transient, MutableSequence):
         if reps == 0:
             self.clear()
         elif reps > 1:
-            n = len(self)
-            for r in range(reps - 1):
-                for (ii,el) in enumerate(self):
-                    if ii > n:
-                        break
-                    else:
-                        self.append(el)
+            # We snapshot the elements so that we never iterate over self while
+            # appending to it.
+            els = list(self)
+            self.extend(chain.from_iterable(repeat(els, reps - 1)))
         return self
     def __mul__(self, value):
         t = self.copy()
@@ -495,8 +466,7 @@ class TransientSequence(Transient, MutableSequence):
     def __reduce__(self):
         return (self.__new__, (type(self), list(self),))
     def __json__(self):
-        from json import dumps
-        return dumps(list(self))    
+        return dumps(list(self))
 
 # Setup the _eq_types, which decides what types can be considered equal.
 PersistentSequence._eq_types = (list, PersistentSequence, TransientSequence)
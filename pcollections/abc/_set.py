@@ -62,6 +62,7 @@ class PersistentSet(Set, Persistent):
      * `removeall(values)`
      * `__reduce__` (for pickling)
     """
+    __slots__ = ()
     # Methods which must be implemented in the children.
     def add(self, obj):
         """Returns a copy of the persistent set that includes the given
@@ -112,42 +113,42 @@ class PersistentSet(Set, Persistent):
                             f" '{type(self)}' and '{type(other)}'")
         t = self.transient()
         t &= other
-        return type(self)(t)
+        return self._from_transient(t)
     def __or__(self, other):
         if not isinstance(other, Set):
             raise TypeError(f"unsupported operand type for |:"
                             f" '{type(self)}' and '{type(other)}'")
         t = self.transient()
         t |= other
-        return type(self)(t)
+        return self._from_transient(t)
     def __sub__(self, other):
         if not isinstance(other, Set):
             raise TypeError(f"unsupported operand type for -:"
                             f" '{type(self)}' and '{type(other)}'")
         t = self.transient()
         t -= other
-        return type(self)(t)
+        return self._from_transient(t)
     def __xor__(self, other):
         if not isinstance(other, Set):
             raise TypeError(f"unsupported operand type for ^:"
                             f" '{type(self)}' and '{type(other)}'")
         t = self.transient()
         t ^= other
-        return type(self)(t)
+        return self._from_transient(t)
     def __rand__(self, other):
         if not isinstance(other, Set):
             raise TypeError(f"unsupported operand type for &:"
                             f" '{type(other)}' and '{type(set)}'")
         t = self.transient()
         t &= other
-        return type(self)(t)
+        return self._from_transient(t)
     def __ror__(self, other):
         if not isinstance(other, Set):
             raise TypeError(f"unsupported operand type for |:"
                             f" '{type(other)}' and '{type(set)}'")
         t = self.transient()
         t |= other
-        return type(self)(t)
+        return self._from_transient(t)
     def __rsub__(self, other):
         if not isinstance(other, Set):
             raise TypeError(f"unsupported operand type for -:"
@@ -155,14 +156,14 @@ class PersistentSet(Set, Persistent):
         t = self.clear().transient()
         t.addall(other)
         t -= self
-        return type(self)(t)
+        return self._from_transient(t)
     def __rxor__(self, other):
         if not isinstance(other, Set):
             raise TypeError(f"unsupported operand type for ^:"
                             f" '{type(other)}' and '{type(set)}'")
         t = self.transient()
         t ^= other
-        return type(self)(t)
+        return self._from_transient(t)
     def isdisjoint(self, other):
         """Returns `True` if two sets have a null intersection."""
         if not isinstance(other, Set):
@@ -189,7 +190,7 @@ class PersistentSet(Set, Persistent):
             t.discardall(arg)
         if len(self) == len(t):
             return self
-        return type(self)(t)
+        return self._from_transient(t)
     def intersection(self, *args):
         """Return the intersection of two sets as a new persistent set.
 
@@ -200,7 +201,7 @@ class PersistentSet(Set, Persistent):
             t &= arg
         if len(t) == len(self):
             return self
-        return type(self)(t)
+        return self._from_transient(t)
     def symmetric_difference(self, *args):
         """Return the symmetric difference of two sets as a new set.
 
@@ -209,9 +210,8 @@ class PersistentSet(Set, Persistent):
         t = self.transient()
         for arg in args:
             t ^= arg
-        if len(t) == len(self):
-            return self
-        return type(self)(t)
+        # The transient returns this set if it was left unchanged.
+        return self._from_transient(t)
     def union(self, *args):
         """Returns the union of the persistent set and all arguments."""
         t = self.transient()
@@ -220,7 +220,7 @@ class PersistentSet(Set, Persistent):
         if len(t) == len(self):
             return self
         else:
-            return type(self)(t)
+            return self._from_transient(t)
     def pop(self):
         """Returns a tuple of an arbitrary element from the persistent set and a
         copy of the set with that element removed.
@@ -250,7 +250,7 @@ class PersistentSet(Set, Persistent):
         if len(t) == len(self):
             return self
         else:
-            return type(self)(t)
+            return self._from_transient(t)
     def discardall(self, iterable):
         """Returns a copy of the persistent set with the given elements
         discarded.
@@ -262,7 +262,7 @@ class PersistentSet(Set, Persistent):
         if len(t) == len(self):
             return self
         else:
-            return type(self)(t)
+            return self._from_transient(t)
     def removeall(self, iterable):
         """Returns a copy of the persistent set with the given elements
         discarded.
@@ -274,7 +274,7 @@ class PersistentSet(Set, Persistent):
         if len(t) == len(self):
             return self
         else:
-            return type(self)(t)
+            return self._from_transient(t)
     def __reduce__(self):
         return (self.__new__, (type(self), list(self),))
 
@@ -337,6 +337,7 @@ class TransientSet(MutableSet, Transient):
      * `discardall(values)`
      * `removeall(values)`
     """
+    __slots__ = ()
     # Methods which must be implemented in the children.
     def add(self, obj):
         """Adds the given object to the transient set."""
@@ -355,8 +356,6 @@ class TransientSet(MutableSet, Transient):
         # We have a max length of 60 characters, not counting the delimiters.
         return f"{{<{seqstr(self, maxlen=60)}>}}"
     def __repr__(self):
-        #s = repr(dict(self))
-        #return f"{{<{s[1:-1]}>}}"
         return f"{{<{seqstr(self)}>}}"
     def __eq__(self, other):
         return setcmp(self, other) == 0
@@ -533,24 +532,27 @@ class TransientSet(MutableSet, Transient):
         """Returns a copy of the persistent set with the given elements
         included.
         """
+        add = self.add
         for el in iterable:
-            self.add(el)
+            add(el)
     def discardall(self, iterable):
         """Returns a copy of the persistent set with the given elements
         discarded.
 
         If any element is not found, then it is ignored.
         """
+        discard = self.discard
         for el in iterable:
-            self.discard(el)
+            discard(el)
     def removeall(self, iterable):
         """Returns a copy of the persistent set with the given elements
         discarded.
 
         If any element is not found, then a `KeyError` is raised.
         """
+        remove = self.remove
         for el in iterable:
-            self.remove(el)
+            remove(el)
     def copy(self):
         """Returns a copy of the transient set."""
         return self.persistent().transient()
@@ -6,6 +6,7 @@
 
 from random import randint
 from unittest import TestCase
+from weakref import ref
 
 from .._dict import (pdict, tdict)
 from .._lazy import (lazy, ldict, tldict, holdlazy)
@@ -46,8 +47,11 @@ class TestPDict(TestCase):
         self.assertIs(p1.clear(), pdict.empty)
         # Copying a pdict always just returns the pdict (it is immutable).
         self.assertIs(p1.copy(), p1)
-        # pdicts are hashable.
+        # pdicts are hashable, and equal pdicts have equal hashes, however they
+        # were built.
         self.assertIsInstance(hash(p1), int)
+        self.assertEqual(hash(p1.set(10, 20).drop(0)),
+                         hash(pdict(zip(range(1,11), range(11,21)))))
         # pdicts contain their keyss.
         for k in range(0,10):
             self.assertIn(k, p1)
@@ -83,11 +87,22 @@ class TestPDict(TestCase):
         l2 = dict(p2)
         l2.update(a=10, b=20)
         self.assertEqual(p2.update(a=10, b=20), l2)
+        self.assertIs(pdict.empty.update(p2), p2)
+        self.assertIs(p2.update(pdict.empty), p2)
+        l2 = dict(p2)
+        l2.update(dict(p1), x=0)
+        self.assertEqual(list(p2.update(p1, x=0).items()), list(l2.items()))
+        self.assertEqual(pdict.empty.update(l2, y=1), dict(l2, y=1))
         # The pop method may be used to extract an item.
         self.assertEqual(p2.pop(1), (11, p2.drop(1)))
         # There are also batch methods for most of the operations.
         self.assertEqual(pdict.empty.setall(range(3), range(0,30,10)),
                          {0:0, 1:10, 2:20})
+        p3 = pdict({0:0, 1:10, 2:20})
+        self.assertEqual(p3.dropall([0, 5]), {1:10, 2:20})
+        self.assertEqual(p3.deleteall([0, 2]), {1:10})
+        with self.assertRaises(KeyError):
+            p3.deleteall([5])
     def test_immutable(self):
         """Ensures that `pdict` throws the right errors when one mutates it."""
         l = pdict(zip(range(10), range(0,100,10)))
@@ -100,6 +115,19 @@ class TestPDict(TestCase):
         # Cannot set-attr.
         with self.assertRaises(TypeError):
             l._top = -10
+    def test_weakref(self):
+        """Ensures that weak references can be made to the dict types."""
+        for d in (pdict(a=1), tdict(a=1), ldict(a=1), tldict(a=1)):
+            self.assertIs(ref(d)(), d)
+    def test_subclass(self):
+        """Ensures that pdict methods preserve subclasses of pdict."""
+        class sub(pdict):
+            __slots__ = ()
+        p = sub(a=1, b=2)
+        self.assertIsInstance(p, sub)
+        for q in (p.setall('cd', (3, 4)), p.dropall('a'), p.deleteall('b'),
+                  p.update(c=3), p.update({'c': 3})):
+            self.assertIs(type(q), sub)
     def test_random(self):
         "Performs a randomized test on the pdict type."
         nops = 100
@@ -144,6 +172,88 @@ class TestPDict(TestCase):
                 tmp = t.persistent()
                 self.assertEqual(tmp, p)
                 self.assertEqual(tmp, t)
+    def test_small(self):
+        """Tests pdicts that grow and shrink across the small-dict threshold."""
+        p = pdict()
+        l = dict()
+        for k in range(40):
+            p = p.set(k, -k)
+            l[k] = -k
+            self.assertEqual(list(p.items()), list(l.items()))
+            self.assertEqual(p.get(k), -k)
+            self.assertIn(k, p)
+        for k in range(0, 40, 3):
+            p = p.drop(k)
+            del l[k]
+            self.assertNotIn(k, p)
+        p = p.set(0, 0)
+        l[0] = 0
+        self.assertEqual(list(p.items()), list(l.items()))
+        while len(p) > 5:
+            (v, p) = p.pop(next(iter(p)))
+            l.pop(next(iter(l)))
+        self.assertEqual(list(p), list(l))
+        self.assertEqual(p, p.transient().persistent())
+        # Reversed iteration follows insertion order backwards.
+        self.assertEqual(list(reversed(p)), list(l)[::-1])
+        self.assertEqual(list(reversed(p.items())), list(l.items())[::-1])
+        self.assertEqual(list(reversed(p.transient().values())),
+                         list(l.values())[::-1])
+        # Small and large pdicts agree on which key objects they keep and on
+        # identity-based lookups (as in dict).
+        nan = float('nan')
+        for n in (1, 40):
+            p = pdict.empty.setall(range(n), range(n)).set(0.0, 'x')
+            t = p.transient()
+            t[0.0] = 'y'
+            for keys in (list(p), list(t), list(t.persistent())):
+                self.assertIs(type(keys[0]), int)
+            p = p.set(nan, 1)
+            self.assertIn(nan, p)
+            self.assertIn(nan, p.transient())
+            self.assertEqual(p[nan], 1)
+    def test_collisions(self):
+        """Ensures that pdict and tdict handle keys with colliding hashes."""
+        class key:
+            def __init__(self, k):
+                self.k = k
+            def __hash__(self):
+                return self.k % 3
+            def __eq__(self, other):
+                return isinstance(other, key) and self.k == other.k
+        ks = [key(k) for k in range(10)]
+        p = pdict(zip(ks, range(10)))
+        t = tdict(zip(ks, range(10)))
+        l = dict(zip(ks, range(10)))
+        self.assertEqual(p, l)
+        self.assertEqual(t, l)
+        self.assertEqual(pdict(l), l)
+        self.assertEqual(pdict(l).drop(ks[3]).get(ks[6]), 6)
+        # Insertion order is preserved even when hashes collide.
+        self.assertEqual(list(p), ks)
+        self.assertEqual(list(pdict(l)), ks)
+        self.assertEqual(list(t), ks)
+        for k in ks:
+            self.assertIn(k, p)
+            self.assertEqual(p[k], l[k])
+        self.assertNotIn(key(10), p)
+        self.assertNotIn(key(10), t)
+        # Dropping and replacing keys that share a hash.
+        for k in ks[1::2]:
+            p = p.drop(k)
+            del t[k]
+            del l[k]
+        p = p.set(ks[0], -1)
+        t[ks[0]] = -1
+        l[ks[0]] = -1
+        self.assertEqual(p, l)
+        self.assertEqual(t, l)
+        self.assertEqual(list(p.items()), list(l.items()))
+        self.assertEqual(p.pop(ks[2]), (l.pop(ks[2]), p.drop(ks[2])))
+        self.assertEqual(t.pop(ks[2]), 2)
+        self.assertIs(p.setdefault(ks[2], 0), p)
+        self.assertEqual(p.setdefault(key(11), 0)[key(11)], 0)
+        self.assertEqual(t.persistent(), l)
 
 class TestLDict(TestCase):
     """Tests for the `ldict` and `lazy` classes.
@@ -290,6 +400,16 @@ class TestLDict(TestCase):
         counter.count = 0
         p1 = ldict(a=lazy(counter, 1), b=lazy(counter, 10))
         self.assertEqual(p1, {'a': 1, 'b': 11})
+        # Popping values also reifies them.
+        p1 = ldict(a=lazy(counter, 1), b=lazy(counter, 10))
+        (v, p1) = p1.pop('b')
+        self.assertEqual(v, 21)
+        self.assertEqual(p1.popitem(), (('a', 22), {}))
+        # Dropping keys, however, does not reify their values.
+        counter.count = 0
+        p1 = ldict(a=lazy(counter, 1), b=lazy(counter, 10))
+        self.assertEqual(p1.dropall(['a', 'c']), {'b': 10})
+        self.assertFalse(p1.is_ready('a'))
     def test_tdict(self):
         """Ensures that tdict objects can be used with pdicts."""
         p = pdict(a=1, b=2, c=3)
@@ -303,6 +423,23 @@ class TestLDict(TestCase):
         self.assertIs(type(t.persistent()), pdict)
         self.assertEqual(t['d'], 10)
         self.assertEqual(t.persistent(), t)
+        self.assertIn(10, t.values())
+        self.assertNotIn(4, t.values())
+        # The hash of a pdict that was hashed before its transient was edited
+        # is tracked through the edits.
+        hash(p)
+        t = p.transient()
+        t['d'] = 4
+        t['a'] = 0
+        del t['b']
+        self.assertEqual(hash(t.persistent()), hash(pdict(a=0, c=3, d=4)))
+        self.assertIn(3, p.values())
+        self.assertNotIn(10, p.values())
+        # The discard method removes a key if it is present.
+        t = p.transient()
+        self.assertTrue(t.discard('a'))
+        self.assertFalse(t.discard('a'))
+        self.assertEqual(t, {'b': 2, 'c': 3})
     def test_tldict(self):
         """Ensures that tldict objects can be used with ldicts."""
         p = ldict(a=1, b=2, c=3)
@@ -316,6 +453,14 @@ class TestLDict(TestCase):
         self.assertIs(type(t.persistent()), ldict)
         self.assertEqual(t['d'], 10)
         self.assertEqual(t.persistent(), t)
+        # Lazy values are only evaluated if no other value matches.
+        t['e'] = lazy(lambda: 20)
+        self.assertIn(10, t.values())
+        self.assertFalse(tdict.__getitem__(t, 'e').is_ready())
+        self.assertIn(20, t.values())
+        self.assertNotIn(30, t.values())
+        self.assertEqual(t.pop('e'), 20)
+        self.assertEqual(t.pop('e', None), None)
     def test_immutable(self):
         """Ensures that `pdict` throws the right errors when one mutates it."""
         l = ldict(zip(range(10), range(0,100,10)))
@@ -6,9 +6,11 @@
 
 from random import randint
 from unittest import TestCase
+from weakref import ref
 
 from .._list import (plist, tlist)
 from .._lazy import (lazy, llist, tllist)
+from ..util import seqstr
 
 class TestPList(TestCase):
     """Tests for the `plist` and `tlist` classes.
@@ -35,6 +37,9 @@ class TestPList(TestCase):
         # Slice access is supported (slices are plists)
         self.assertEqual(p1[0:10:2], [0,2,4,6,8])
         self.assertIsInstance(p1[:-1], plist)
+        self.assertEqual(p1[::-3], [9,6,3,0])
+        self.assertEqual(p1.prepend(-1)[-3:1:-2], [7,5,3,1])
+        self.assertEqual(p1.transient()[8:2:-3], [8,5])
         # plists can be equal to each other and to other lists (but, like with
         # list, not to other sequences like tuples or strings).
         l1 = list(range(10))
@@ -43,6 +48,9 @@ class TestPList(TestCase):
         self.assertEqual(p1, plist(range(10)))
         self.assertNotEqual(p1, tuple(p1))
         self.assertNotEqual(plist.empty, '')
+        # Equality does not require the elements to be orderable.
+        self.assertEqual(plist([None, {}]), [None, {}])
+        self.assertNotEqual(plist([1, 'a']), [1, 2])
         # plists can perform ordering comparisons like list as well.
         self.assertLessEqual(p1[:4], p1)
         self.assertGreater(p1[4:], p1)
@@ -64,15 +72,28 @@ class TestPList(TestCase):
         self.assertEqual(p1.count(4), 1)
         self.assertEqual(p1.count(-4), 0)
         self.assertEqual(plist([1,2,3,3,4,5,3,3,6]).count(3), 4)
+        self.assertEqual(tlist([1,2,3,3,4,5,3,3,6]).count(3), 4)
+        self.assertEqual(plist([3,1]).prepend(3).count(3), 2)
         self.assertEqual(p1.index(5), 5)
+        self.assertEqual(plist([3,1,3,2,3]).index(3, -3, -1), 2)
+        self.assertEqual(tlist([3,1,3,2,3]).index(3, 1), 2)
         # The reverse method does not mutate it in-place; instead it returns
         # a reversed plist. This is equivalent to the __reversed__ method.
         self.assertEqual(p1.reverse(), list(reversed(p1)))
+        p100 = plist(range(100)).prepend(-1)
+        self.assertEqual(list(reversed(p100)), list(p100)[::-1])
+        self.assertEqual(list(reversed(p100.transient())), list(p100)[::-1])
         self.assertIsNot(p1.reverse(), p1)
         self.assertIsInstance(p1.reverse(), plist)
+        t = p1.transient()
+        t.reverse()
+        self.assertEqual(t, p1.reverse())
         # The sort method also returns a sorted plist.
         self.assertEqual(p1.sort(), p1)
         self.assertEqual(p1.reverse().sort(), p1)
+        t = p1.reverse().transient()
+        t.sort()
+        self.assertEqual(t, p1)
         # Mutating elements is done by creating a copy with the desired mutation
         # using the set method. This leaves the original object unchanged.
         p2 = p1.set(0, 10)
@@ -96,6 +117,8 @@ class TestPList(TestCase):
         # as list + sequence.
         self.assertEqual(p3.extend([4,5,6]), [1,2,3,4,5,6])
         self.assertEqual(p3.extend([4,5,6]), p3 + [4,5,6])
+        self.assertEqual(p3.prepend(0).extend(range(4, 10)), list(range(10)))
+        self.assertEqual(p3.extend(x for x in [4]), [1,2,3,4])
         self.assertEqual([-1,0] + p3, [-1,0,1,2,3])
         # plists can also be multiplied.
         self.assertEqual(plist([1]) * 5, [1,1,1,1,1])
@@ -116,6 +139,26 @@ class TestPList(TestCase):
         # Cannot set-attr.
         with self.assertRaises(TypeError):
             l._start = -10
+    def test_weakref(self):
+        """Ensures that weak references can be made to the list types."""
+        for l in (plist([1]), tlist([1]), llist([1]), tllist([1])):
+            self.assertIs(ref(l)(), l)
+    def test_str(self):
+        """Ensures that plists are formatted with `seqstr` correctly."""
+        self.assertEqual(str(plist(range(3))), "[|0, 1, 2|]")
+        self.assertEqual(seqstr(range(10), 12), "0, 1, 2, ...")
+        # The first element is always formatted, even if the separator is
+        # longer than maxlen.
+        self.assertEqual(seqstr(['x'], maxlen=3, sep=' -- '), "'x'")
+    def test_subclass(self):
+        """Ensures that plist methods preserve subclasses of plist."""
+        class sub(plist):
+            __slots__ = ()
+        p = sub([3, 1, 2])
+        self.assertIsInstance(p, sub)
+        for q in (p.sort(), p.reverse(), p.extend([4]), [0] + p, p * 2,
+                  sub([0]) + p):
+            self.assertIs(type(q), sub)
     def test_mul(self):
         "Tests the plist multiplication operator."
         l = plist(range(10))
@@ -128,6 +171,10 @@ class TestPList(TestCase):
         self.assertEqual(l, ll[10:])
         self.assertEqual(ll[:10], l)
         self.assertEqual(ll[10:], l)
+        self.assertEqual(l.prepend(-1) * 3, ([-1] + list(l)) * 3)
+        t = l.transient()
+        t *= 3
+        self.assertEqual(t, list(l) * 3)
         # Cannot multiply by a non-integer
         for notint in ['x', [1], 5.5]:
             with self.assertRaises(ValueError):
@@ -147,6 +194,21 @@ class TestPList(TestCase):
         for ll in (l + l, l + list(l)):
             self.assertEqual(l, ll[:10])
             self.assertEqual(l, ll[10:])
+        # A short plist plus a long one:
+        self.assertEqual(plist([-2, -1]) + l, [-2, -1] + list(l))
+        # Extending a transient in place:
+        t = l.prepend(-1).transient()
+        t.extend(iter(range(10, 12)))
+        t.extend(t)
+        self.assertEqual(t, 2*([-1] + list(range(12))))
+        t = tlist()
+        t.extend(range(3))
+        self.assertEqual(t, [0, 1, 2])
+        # A list plus a tlist is a new tlist.
+        u = [-2, -1] + t
+        self.assertIsInstance(u, tlist)
+        self.assertEqual(u, [-2, -1, 0, 1, 2])
+        self.assertEqual(t, [0, 1, 2])
         # Cannot add non-lists to lists.
         for notlist in [5,'5',(5,)]:
             with self.assertRaises(TypeError):
@@ -370,6 +432,23 @@ class TestLList(TestCase):
         counter.count = 0
         p1 = llist([lazy(counter, 1), lazy(counter, 10)])
         self.assertEqual(p1, [1, 11])
+        # The ready_all method evaluates all the lazy values at once.
+        counter.count = 0
+        p1 = llist([lazy(counter, 1), 5, lazy(counter, 10)])
+        self.assertFalse(p1.is_ready(0))
+        self.assertIs(p1.ready_all(), p1)
+        self.assertTrue(all(p1.is_ready(k) for k in range(3)))
+        self.assertEqual(counter.count, 11)
+        # Thread-safe lazy values behave the same way.
+        counter.count = 0
+        lazy.thread_safe = True
+        try:
+            p1 = llist([lazy(counter, 1), lazy(counter, 10)])
+        finally:
+            lazy.thread_safe = False
+        self.assertEqual(p1, [1, 11])
+        self.assertEqual(p1, [1, 11])
+        self.assertEqual(counter.count, 11)
     def test_immutable(self):
         """Ensures that `plist` throws the right errors when one mutates it."""
         l = llist(range(10))
@@ -6,6 +6,7 @@
 
 from random import randint
 from unittest import TestCase
+from weakref import ref
 
 from .._set import (pset, tset)
 
@@ -111,6 +112,7 @@ class TestPSet(TestCase):
         self.assertEqual(p1.symmetric_difference(p3), set((1,2,3,5,6,7)))
         self.assertEqual(p2.symmetric_difference(p1), set((1,4)))
         self.assertEqual(p3.symmetric_difference(p1), set((1,2,3,5,6,7)))
+        self.assertEqual(pset((1,2)).symmetric_difference({1,3}), set((2,3)))
         self.assertEqual(p1.intersection(p2), set((2,3)))
         self.assertEqual(p1.intersection(p3), set())
         self.assertEqual(p2.intersection(p1), set((2,3)))
@@ -125,6 +127,59 @@ class TestPSet(TestCase):
         # Cannot set-attr.
         with self.assertRaises(TypeError):
             l._top = -10
+    def test_weakref(self):
+        """Ensures that weak references can be made to the set types."""
+        for s in (pset([1]), tset([1])):
+            self.assertIs(ref(s)(), s)
+    def test_subclass(self):
+        """Ensures that pset methods preserve subclasses of pset."""
+        class sub(pset):
+            __slots__ = ()
+        p = sub(tset([1, 2]))
+        self.assertIsInstance(p, sub)
+        for q in (p.addall([3]), p.discardall([1]), p | {3}, p & {1},
+                  p - {1}, p ^ {1, 3}):
+            self.assertIs(type(q), sub)
+    def test_collisions(self):
+        """Ensures that pset and tset handle objects with colliding hashes."""
+        class obj:
+            def __init__(self, k):
+                self.k = k
+            def __hash__(self):
+                return self.k % 3
+            def __eq__(self, other):
+                return isinstance(other, obj) and self.k == other.k
+        xs = [obj(k) for k in range(10)]
+        p = pset(xs)
+        t = tset(xs)
+        self.assertEqual(len(p), 10)
+        self.assertEqual(list(p), xs)
+        self.assertIs(p.add(obj(4)), p)
+        self.assertNotIn(obj(10), p)
+        self.assertNotIn(obj(10), t)
+        for x in xs[1::2]:
+            p = p.discard(x)
+            t.discard(x)
+        self.assertEqual(list(p), xs[0::2])
+        self.assertEqual(list(t), xs[0::2])
+        for x in xs:
+            self.assertEqual(x in p, x.k % 2 == 0)
+            self.assertEqual(x in t, x.k % 2 == 0)
+        self.assertEqual(t.persistent(), p)
+        # Equal sets have equal hashes, however they were built; once a set
+        # has been hashed, its hash is maintained through adds and discards.
+        q = pset(xs[-2::-2])
+        self.assertEqual(hash(p), hash(q))
+        self.assertEqual(hash(pset(range(5)).discard(2)),
+                         hash(pset([4, 3, 1, 0])))
+        hash(q)
+        q = q.add(xs[1]).discard(xs[0]).add(xs[0]).discard(xs[1])
+        self.assertEqual(hash(q), hash(p))
+        t = q.transient()
+        t.add(obj(20))
+        t.discard(xs[2])
+        self.assertEqual(hash(t.persistent()),
+                         hash(pset([obj(20), xs[0]] + xs[4::2])))
     def test_random(self):
         "Performs a randomized test on the pset type."
         nops = 400
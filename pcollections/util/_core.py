@@ -60,13 +60,18 @@ def seqcmp(seq1, seq2):
     `b`, and 1 if `a` sorts after `b`.
     """
     if not isinstance(seq1, Sequence):
-        msg = f"unsupported operand type for compare: {type(setq)}"
+        msg = f"unsupported operand type for compare: {type(seq1)}"
         raise TypeError(msg)
     if not isinstance(seq2, Sequence):
         msg = f"unsupported operand type for compare: {type(seq2)}"
         raise TypeError(msg)
+    # Like list, we skip over equal elements (checking identity first) and
+    # only order-compare the first pair that differs; this needs a single
+    # comparison per element in the common prefix rather than two.
     for (a,b) in zip(seq1, seq2):
-        if a < b:
+        if a is b or a == b:
+            continue
+        elif a < b:
             return -1
         elif b < a:
             return 1
@@ -101,11 +106,16 @@ def seqstr(seq, maxlen=None, sep=", ", tostr=repr):
     parts = []
     N = 0
     for el in seq:
-        s = tostr(el)
-        parts.append(s)
-        n = len(s)
-        N = n if N == 0 else N + seplen + n
-        if N > maxlen:
+        if parts and N > maxlen - seplen:
+            # Any further element would overshoot, so we needn't format it.
+            overshot = True
+        else:
+            s = tostr(el)
+            parts.append(s)
+            n = len(s)
+            N = n if N == 0 else N + seplen + n
+            overshot = N > maxlen
+        if overshot:
             # We've overshot; remove the final element if need-be.
             while len(parts) > 0 and N + elllen > maxlen:
                 s = parts.pop()